@@ -1,12 +1,242 @@
-import sqlite3 , string , random
+import csv, io, string, secrets
 import streamlit as st
-from werkzeug.security import generate_password_hash
-from auth import get_db_connection, logout
+from auth import logout, provision_users
+from db import get_db_connection
+import metrics
+import presence
+import writer
+from paging import cursor_stack, current_cursor, page_controls
+from passwords import hash_passwords
 
-def generate_token(length=8):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+USERS_PER_PAGE = 50
+BULK_ACTIONS = ["Delete", "Make Admin", "Remove Admin", "Reset Password"]
 
+def like_pattern(text):
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
 
+# One page of users matching the filters, keyset-paged on id
+def find_users(conn, text='', role='All', after_id=0, limit=USERS_PER_PAGE):
+    conditions = ['id > ?']
+    params = [after_id]
+    if text:
+        conditions.append("(username LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\')")
+        params += [like_pattern(text)] * 3
+    if role == 'Admins':
+        conditions.append('is_admin = 1')
+    elif role == 'Users':
+        conditions.append('is_admin = 0')
+    params.append(limit)
+    return conn.execute(f'''
+        SELECT id, username, name, email, is_admin, is_original_admin FROM users
+        WHERE {' AND '.join(conditions)}
+        ORDER BY id
+        LIMIT ?
+    ''', params).fetchall()
+
+# Applies one action to many users in a single transaction. The original admin
+# can't be deleted or demoted. Returns {username: temporary password} for
+# password resets, otherwise an empty dict.
+def apply_bulk_action(action, user_ids):
+    temporary_passwords = {}
+    conn = get_db_connection()
+    try:
+        ids = [(user_id,) for user_id in user_ids]
+        if action == "Delete":
+            conn.executemany('DELETE FROM users WHERE id = ? AND is_original_admin = 0', ids)
+        elif action == "Make Admin":
+            conn.executemany('UPDATE users SET is_admin = 1 WHERE id = ?', ids)
+        elif action == "Remove Admin":
+            conn.executemany('UPDATE users SET is_admin = 0 WHERE id = ? AND is_original_admin = 0', ids)
+        elif action == "Reset Password":
+            placeholders = ', '.join('?' * len(user_ids))
+            users = conn.execute(f'SELECT id, username FROM users WHERE id IN ({placeholders})', user_ids).fetchall()
+            new_passwords = [secrets.token_urlsafe(12) for _ in users]
+            hashes = hash_passwords(new_passwords)
+            conn.executemany('UPDATE users SET password = ? WHERE id = ?',
+                             [(pwhash, user['id']) for pwhash, user in zip(hashes, users)])
+            temporary_passwords = {user['username']: password for user, password in zip(users, new_passwords)}
+        conn.commit()
+    finally:
+        conn.close()
+    return temporary_passwords
+
+def manage_users(conn):
+    st.header("Manage Users")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        text = st.text_input("Filter by username, name or email", key="admin_user_filter")
+    with col2:
+        role = st.selectbox("Role", ["All", "Admins", "Users"], key="admin_user_role")
+
+    cursors = cursor_stack('admin_users', (text, role))
+    users = find_users(conn, text, role, current_cursor(cursors, 0))
+
+    rows = [{"Select": False, "ID": user['id'], "Username": user['username'], "Name": user['name'],
+             "Email": user['email'], "Role": "Admin" if user['is_admin'] else "User",
+             "Original Admin": bool(user['is_original_admin'])} for user in users]
+    # The editor keeps ticks by row position, so it gets a fresh key whenever
+    # an action changes which users fill the page
+    editor_version = st.session_state.setdefault('admin_users_editor', 0)
+    edited = st.data_editor(rows, key=f"admin_users_{editor_version}_{len(cursors)}_{text}_{role}", hide_index=True,
+                            disabled=["ID", "Username", "Name", "Email", "Role", "Original Admin"])
+    selected = [row["ID"] for row in edited if row["Select"]]
+
+    page_controls('admin_users', cursors, users[-1]['id'] if len(users) == USERS_PER_PAGE else None)
+
+    action = st.selectbox("Action for selected users", BULK_ACTIONS, key="admin_bulk_action")
+    if st.button(f"Apply to {len(selected)} selected", key="admin_bulk_apply", disabled=not selected):
+        temporary_passwords = apply_bulk_action(action, selected)
+        st.session_state.admin_bulk_result = (f"{action} applied to {len(selected)} users.", temporary_passwords)
+        st.session_state.admin_users_editor += 1
+        st.rerun()
+
+    # Shown once, on the rerun after the action
+    result = st.session_state.pop('admin_bulk_result', None)
+    if result:
+        message, temporary_passwords = result
+        st.success(message)
+        if temporary_passwords:
+            st.write("Temporary passwords (shown once):")
+            st.table([{"Username": username, "Password": password}
+                      for username, password in temporary_passwords.items()])
+
+    with st.expander("Import Users from CSV"):
+        import_users()
+
+
+TOKENS_PER_PAGE = 50
+TOKEN_ALPHABET = string.ascii_letters + string.digits
+
+def generate_token(length=12):
+    return ''.join(secrets.choice(TOKEN_ALPHABET) for _ in range(length))
+
+# Creates count new tokens in one transaction and returns them
+def generate_tokens(conn, count, created_by):
+    tokens = []
+    while len(tokens) < count:
+        token = generate_token()
+        # OR IGNORE: a collision with an existing token just draws another one
+        if conn.execute('INSERT OR IGNORE INTO tokens (token, created_by) VALUES (?, ?)', (token, created_by)).rowcount:
+            tokens.append(token)
+    conn.commit()
+    return tokens
+
+def token_conditions(status):
+    if status == "Unused":
+        return 'is_used = 0'
+    if status == "Used":
+        return 'is_used = 1'
+    return '1'
+
+# One page of tokens, keyset-paged on rowid
+def find_tokens(conn, status="All", after_rowid=0, limit=TOKENS_PER_PAGE):
+    return conn.execute(f'''
+        SELECT rowid, token, is_used, created_by FROM tokens
+        WHERE {token_conditions(status)} AND rowid > ?
+        ORDER BY rowid
+        LIMIT ?
+    ''', (after_rowid, limit)).fetchall()
+
+def tokens_csv(conn, status="All"):
+    output = io.StringIO()
+    out = csv.writer(output)
+    out.writerow(["token", "is_used", "created_by"])
+    for row in conn.execute(f'SELECT token, is_used, created_by FROM tokens WHERE {token_conditions(status)} ORDER BY rowid'):
+        out.writerow([row['token'], row['is_used'], row['created_by']])
+    return output.getvalue()
+
+def temporary_passwords_csv(temporary_passwords):
+    output = io.StringIO()
+    out = csv.writer(output)
+    out.writerow(["username", "password"])
+    out.writerows(temporary_passwords.items())
+    return output.getvalue()
+
+def manage_tokens(conn):
+    st.header("Manage Registration Tokens")
+    token_action = st.radio("Select Action", ["Generate New Token", "View Tokens", "Delete Token"])
+
+    if token_action == "Generate New Token":
+        count = st.number_input("Number of tokens", min_value=1, max_value=5000, step=1, key="token_count")
+        if st.button("Generate Token"):
+            tokens = generate_tokens(conn, int(count), st.session_state['user']['id'])
+            if len(tokens) == 1:
+                st.success(f"Token generated: {tokens[0]}")
+            else:
+                st.success(f"{len(tokens)} tokens generated.")
+                st.download_button("Download New Tokens (CSV)", "token\n" + "\n".join(tokens) + "\n",
+                                   file_name="new_tokens.csv", mime="text/csv")
+
+    elif token_action == "View Tokens":
+        status = st.selectbox("Show", ["All", "Unused", "Used"], key="token_status")
+        cursors = cursor_stack('tokens', status)
+        tokens = find_tokens(conn, status, current_cursor(cursors, 0))
+
+        rows = [{"Select": False, "Token": token['token'], "Used": bool(token['is_used']),
+                 "Created By": token['created_by']} for token in tokens]
+        # Fresh key after a delete, or the next tokens would inherit the ticks
+        editor_version = st.session_state.setdefault('tokens_editor', 0)
+        edited = st.data_editor(rows, key=f"tokens_{editor_version}_{status}_{len(cursors)}", hide_index=True,
+                                disabled=["Token", "Used", "Created By"])
+        selected = [row["Token"] for row in edited if row["Select"] and not row["Used"]]
+
+        page_controls('tokens', cursors, tokens[-1]['rowid'] if len(tokens) == TOKENS_PER_PAGE else None)
+
+        if st.button(f"Delete {len(selected)} selected unused tokens", key="tokens_delete", disabled=not selected):
+            conn.executemany('DELETE FROM tokens WHERE token = ? AND is_used = 0', [(token,) for token in selected])
+            conn.commit()
+            st.session_state.tokens_editor = editor_version + 1
+            st.session_state.tokens_deleted = len(selected)
+            st.rerun()
+        deleted = st.session_state.pop('tokens_deleted', None)
+        if deleted:
+            st.success(f"{deleted} tokens deleted.")
+        if st.button("Prepare CSV Export", key="tokens_export"):
+            st.download_button("Download Tokens (CSV)", tokens_csv(conn, status),
+                               file_name=f"tokens_{status.lower()}.csv", mime="text/csv")
+
+    elif token_action == "Delete Token":
+        token = st.text_input("Token to delete", key="token_to_delete")
+        if st.button("Delete Token") and token:
+            cursor = conn.execute('DELETE FROM tokens WHERE token = ? AND is_used = 0', (token,))
+            conn.commit()
+            if cursor.rowcount:
+                st.success(f"Token {token} deleted.")
+            else:
+                st.error("No unused token with that value.")
+
+def import_users():
+    st.caption("Columns: username, email, name, password (optional; a temporary one is generated when blank).")
+    upload = st.file_uploader("CSV file", type=["csv"], key="import_users_file")
+    if upload is not None and st.button("Import Users", key="import_users_button"):
+        reader = csv.DictReader(io.StringIO(upload.getvalue().decode('utf-8-sig')))
+        created, skipped, temporary_passwords = provision_users(list(reader))
+        st.success(f"Created {created} users.")
+        if skipped:
+            st.warning(f"Skipped {len(skipped)} rows.")
+            st.table([{"Row": row, "Reason": reason} for row, reason in skipped])
+        if temporary_passwords:
+            st.write("Temporary passwords (shown once):")
+            st.download_button("Download Temporary Passwords (CSV)", temporary_passwords_csv(temporary_passwords),
+                               file_name="temporary_passwords.csv", mime="text/csv")
+
+
+def performance_tab():
+    st.subheader("Page Renders")
+    st.dataframe(metrics.summary('render'), hide_index=True)
+    st.subheader("SQL Statements")
+    st.caption("Timed up to the first result row, slowest total time first.")
+    st.dataframe(metrics.summary('query')[:100], hide_index=True)
+    st.subheader("Background Writer")
+    st.dataframe([writer.stats()], hide_index=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download Prometheus Metrics", metrics.prometheus_text(),
+                           file_name="dashboard.prom", mime="text/plain")
+    with col2:
+        if st.button("Reset Metrics", key="reset_metrics"):
+            metrics.reset()
+            st.rerun()
 
 def admin_panel():
     conn = get_db_connection()
@@ -15,7 +245,7 @@ def admin_panel():
         return
 
     st.title("Admin Panel")
-    tab1, tab2, tab3,tab4 = st.tabs(["Create New Chat", "Manage Users", "Manage Tokens", "Online Users"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Create New Chat", "Manage Users", "Manage Tokens", "Online Users", "Performance"])
     # Create New Chat
     with tab1:
         st.header("Create New Chat")
@@ -31,78 +261,13 @@ def admin_panel():
 
     # Manage Users
     with tab2:
-        st.header("Manage Users")
-        users = conn.execute('SELECT * FROM users').fetchall()
-
-        for user in users:
-            col1, col2, col3, col4, col5, col6 = st.columns([2, 1, 1, 1, 1, 2])
-            with col1:
-                st.write(f"**{user['username']}**")
-            with col2:
-                st.write("Admin" if user['is_admin'] else "User")
-            with col3:
-                if user['is_original_admin'] == 0:  # Only allow deletion if not original admin
-                    if st.button(f"Delete User", key=f"delete_user_{user['id']}"):
-                        conn.execute('DELETE FROM users WHERE id = ?', (user['id'],))
-                        conn.commit()
-                        st.success(f"User {user['username']} deleted.")
-                        st.rerun()
-                else:
-                    st.write("Cannot delete original admin")
-            with col4:
-                if user['is_admin'] == 0:  # Only allow promoting if not already an admin
-                    if st.button(f"Make Admin", key=f"make_admin_{user['id']}"):
-                        conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user['id'],))
-                        conn.commit()
-                        st.success(f"User {user['username']} is now an admin.")
-                        st.rerun()
-                    
-                else:
-                    st.write("Already an admin")
-            with col5:
-                if user['is_admin'] == 1 and user['is_original_admin'] == 0:  # Only allow demoting if not original admin
-                    if st.button(f"Remove Admin", key=f"remove_admin_{user['id']}"):
-                        conn.execute('UPDATE users SET is_admin = 0 WHERE id = ?', (user['id'],))
-                        conn.commit()
-                        st.success(f"User {user['username']} is no longer an admin.")
-                        st.rerun()
-                      
-                else:
-                    st.write("Cannot remove original admin status")
-            with col6:
-                reset_clicked = st.button(f"Reset Password", key=f"reset_password_{user['id']}")
-                if reset_clicked:
-                    new_password = st.text_input(f"Enter new password for {user['username']}", type="password", key=f"new_password_{user['id']}")
-                    update_clicked = st.button(f"Update Password", key=f"update_password_{user['id']}")
-                    if update_clicked and new_password:
-                        conn.execute('UPDATE users SET password = ? WHERE id = ?', (generate_password_hash(new_password), user['id']))
-                        conn.commit()
-                        st.success(f"Password for user {user['username']} updated.")
+        manage_users(conn)
     with tab3:
     # Manage Tokens
-        st.header("Manage Registration Tokens")
-        token_action = st.radio("Select Action", ["Generate New Token", "View Tokens", "Delete Token"])
-
-        if token_action == "Generate New Token":
-            if st.button("Generate Token"):
-                token = generate_token()
-                conn.execute('INSERT INTO tokens (token, created_by) VALUES (?, ?)', (token, st.session_state['user']['id']))
-                conn.commit()
-                st.success(f"Token generated: {token}")
-
-        elif token_action == "View Tokens":
-            tokens = conn.execute('SELECT * FROM tokens').fetchall()
-            for token in tokens:
-                st.write(f"Token: {token['token']}, Used: {'Yes' if token['is_used'] else 'No'}, Created By: {token['created_by']}")
-                if not token['is_used']:
-                    if st.button(f"Delete Token {token['token']}"):
-                        conn.execute('DELETE FROM tokens WHERE token = ?', (token['token'],))
-                        conn.commit()
-                        st.success(f"Token {token['token']} deleted.")
-                        st.rerun()
+        manage_tokens(conn)
     with tab4:                
         st.subheader("Online Users")
-        online_users = conn.execute('SELECT * FROM users WHERE is_online = 1').fetchall()
+        online_users = presence.online_users()
         if online_users:
             for user in online_users:
                 st.write(f"**{user['username']}** (Online)")
@@ -112,6 +277,8 @@ def admin_panel():
         if st.button("Logout", key="logout_button"):
             logout()
             st.rerun()
+    with tab5:
+        performance_tab()
     conn.close()
 
 
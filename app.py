@@ -1,14 +1,36 @@
+import importlib
+
 import streamlit as st
 
-from prof import edit_profile, view_profiles
-from notes import notes_main
-from todo import todo_section
-from group_chat import chat_section
-from admin import admin_panel
+import metrics
+import presence
+from auth import logout, register, login
 from db import init_db
 
 
-from auth import logout, register, login
+# Menu entry -> (module, functions rendering the page, admin only). Page
+# modules are imported the first time someone opens them, so the login screen
+# and the other pages don't pay for their dependencies.
+PAGES = {
+    "Profile": ('prof', ('edit_profile', 'view_profiles'), False),
+    "Notes": ('notes', ('notes_main',), False),
+    "To-Do List": ('todo', ('todo_section',), False),
+    "Group Chats": ('group_chat', ('chat_section',), False),
+    "Admin Panel": ('admin', ('admin_panel',), True),
+}
+
+
+def render_page(name):
+    module_name, functions, _ = PAGES[name]
+    module = importlib.import_module(module_name)
+    for function in functions:
+        getattr(module, function)()
+
+
+# Heartbeat while the tab is open; closed tabs stop sending and expire
+@st.fragment(run_every=presence.TOUCH_INTERVAL)
+def presence_heartbeat(user_id):
+    presence.touch(user_id)
 
 
 def main():
@@ -28,27 +50,19 @@ def main():
         with tab2:
             register()
     else:
+        presence_heartbeat(st.session_state['user']['id'])
         st.sidebar.title("Menu")
-        menu_options = ["Profile", "Notes", "To-Do List", "Group Chats"]
-        if st.session_state['user']['is_admin']:
-            menu_options.append("Admin Panel")
+        is_admin = st.session_state['user']['is_admin']
+        menu_options = [name for name, (_, _, admin_only) in PAGES.items() if is_admin or not admin_only]
         selected_menu = st.sidebar.selectbox("Navigate", menu_options)
         st.sidebar.markdown("---")
         if st.sidebar.button("Logout"):
             logout()
             st.rerun()
         
-        if selected_menu == "Profile":
-            edit_profile()
-            view_profiles()
-        elif selected_menu == "Notes":
-            notes_main()
-        elif selected_menu == "To-Do List":
-            todo_section()
-        elif selected_menu == "Group Chats":
-            chat_section()
-        elif selected_menu == "Admin Panel":
-            admin_panel()
+        with metrics.timed('render', selected_menu):
+            render_page(selected_menu)
+        metrics.maybe_write_file()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,125 @@
+import hashlib
+import io
+import os
+
+import query_cache
+
+# Content-addressed attachment store. File bytes live once in `attachments`
+# keyed by their SHA-256; `note_attachments` links notes to them with the
+# per-file metadata, so listing notes never has to read any file data.
+#
+# File data is streamed through incremental BLOB I/O in CHUNK_SIZE pieces, so
+# storing or reading an attachment never needs the whole file as one bytes
+# object on our side.
+
+CHUNK_SIZE = 1024 * 1024
+MAX_ATTACHMENT_BYTES = int(os.environ.get('DASHBOARD_MAX_ATTACHMENT_MB', '200')) * 1024 * 1024
+
+
+class AttachmentTooLarge(ValueError):
+    pass
+
+
+def _chunks(file):
+    file.seek(0)
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in _chunks(file):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+def store(conn, file):
+    digest, size = content_hash(file)
+    if size > MAX_ATTACHMENT_BYTES:
+        raise AttachmentTooLarge(f"Attachment is {size} bytes; the limit is {MAX_ATTACHMENT_BYTES} bytes.")
+    cursor = conn.execute('INSERT OR IGNORE INTO attachments (hash, size, data) VALUES (?, ?, zeroblob(?))',
+                          (digest, size, size))
+    if cursor.rowcount and size:
+        with conn.blobopen('attachments', 'data', cursor.lastrowid) as blob:
+            for chunk in _chunks(file):
+                blob.write(chunk)
+    return digest, size
+
+def attach(conn, note_id, name, mime, file):
+    if isinstance(file, bytes):
+        file = io.BytesIO(file)
+    digest, size = store(conn, file)
+    conn.execute('INSERT INTO note_attachments (note_id, hash, name, mime, size) VALUES (?, ?, ?, ?, ?)',
+                 (note_id, digest, name, mime or 'application/octet-stream', size))
+    return digest
+
+def attach_files(conn, note_id, files):
+    for file in files:
+        attach(conn, note_id, file.name, file.type, file)
+
+def detach_all(conn, note_id):
+    hashes = [row['hash'] for row in
+              conn.execute('SELECT DISTINCT hash FROM note_attachments WHERE note_id = ?', (note_id,))]
+    conn.execute('DELETE FROM note_attachments WHERE note_id = ?', (note_id,))
+    prune(conn, hashes)
+
+def prune(conn, hashes):
+    # Drop file data no longer referenced by any note
+    conn.executemany('''
+        DELETE FROM attachments
+        WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM note_attachments WHERE note_attachments.hash = attachments.hash)
+    ''', [(digest,) for digest in hashes])
+
+def list_for_notes(conn, note_ids, chunk_size=500):
+    listing = {note_id: [] for note_id in note_ids}
+    for start in range(0, len(note_ids), chunk_size):
+        chunk = note_ids[start:start + chunk_size]
+        placeholders = ', '.join('?' * len(chunk))
+        rows = query_cache.fetchall(conn, f'''
+            SELECT id, note_id, hash, name, mime, size FROM note_attachments
+            WHERE note_id IN ({placeholders})
+            ORDER BY id
+        ''', chunk)
+        for row in rows:
+            listing[row['note_id']].append(row)
+    return listing
+
+
+class BlobReader(io.RawIOBase):
+    # Read-only file object over an attachment's BLOB, for APIs that take files
+    def __init__(self, blob):
+        self._blob = blob
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._blob.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def tell(self):
+        return self._blob.tell()
+
+    def close(self):
+        if not self.closed:
+            self._blob.close()
+        super().close()
+
+
+def open_reader(conn, digest):
+    row = conn.execute('SELECT rowid FROM attachments WHERE hash = ?', (digest,)).fetchone()
+    if row is None:
+        return None
+    return io.BufferedReader(BlobReader(conn.blobopen('attachments', 'data', row[0], readonly=True)),
+                             buffer_size=CHUNK_SIZE)
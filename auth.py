@@ -1,41 +1,21 @@
-import sqlite3 ,re
+import sqlite3 ,re, uuid, secrets, math
 import streamlit as st
-from werkzeug.security import generate_password_hash, check_password_hash
-
-# Database connection
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
+from db import get_db_connection, init_db
+import presence
+from passwords import hash_password, hash_passwords, verify_password, needs_rehash
+from ratelimit import RateLimiter
 
 # Create users table
 def create_users_table():
-    conn = get_db_connection()
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            email TEXT NOT NULL UNIQUE,
-            name TEXT NOT NULL,
-            job_profile TEXT,
-            github TEXT,
-            discord TEXT,
-            is_admin INTEGER DEFAULT 0,
-            is_original_admin INTEGER DEFAULT 0,
-            is_online INTEGER DEFAULT 0
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    # The users table is part of the shared schema managed by db migrations
+    init_db()
 
 # Register user
 def register_user(username, password, email, name, token):
     conn = get_db_connection()
     user_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
     is_admin = 1 if user_count == 0 else 0
-    hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+    hashed_password = hash_password(password)
     
     # Validate token only if provided
     if token:
@@ -61,7 +41,7 @@ def register_user_notoken(username, password, email, name):
     conn = get_db_connection()
     user_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
     is_admin = 1 if user_count == 0 else 0
-    hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+    hashed_password = hash_password(password)
     
     # Validate token only if provided
     
@@ -76,20 +56,51 @@ def register_user_notoken(username, password, email, name):
     finally:
         conn.close()
 
+def user_count():
+    conn = get_db_connection()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    finally:
+        conn.close()
+
 # Update user status (online/offline)
 def update_user_status(user_id, is_online):
+    if is_online:
+        presence.touch(user_id)
+    else:
+        presence.go_offline(user_id)
+
+# Login attempts allowed per username and per browser session
+username_limiter = RateLimiter(capacity=5, refill_seconds=30)
+session_limiter = RateLimiter(capacity=10, refill_seconds=6)
+
+# Check credentials; returns the user row as a dict, or None
+def authenticate(username, password):
     conn = get_db_connection()
-    conn.execute('UPDATE users SET is_online = ? WHERE id = ?', (is_online, user_id))
-    conn.commit()
+    user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
     conn.close()
+    if not user or not verify_password(user['password'], password):
+        return None
+    user = dict(user)
+    # Upgrade hashes made with an older method or iteration count
+    if needs_rehash(user['password']):
+        user['password'] = hash_password(password)
+        conn = get_db_connection()
+        conn.execute('UPDATE users SET password = ? WHERE id = ?', (user['password'], user['id']))
+        conn.commit()
+        conn.close()
+    return user
 
 # Login user
 def login_user(username, password):
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-    conn.close()
-    if user and check_password_hash(user['password'], password):
-        st.session_state['user'] = dict(user)
+    session_key = st.session_state.setdefault('login_session_key', uuid.uuid4().hex)
+    if not (session_limiter.allow(session_key) and username_limiter.allow(username.lower())):
+        wait = max(session_limiter.retry_after(session_key), username_limiter.retry_after(username.lower()))
+        st.error(f"Too many login attempts. Please try again in {math.ceil(wait)} s.")
+        return False
+    user = authenticate(username, password)
+    if user:
+        st.session_state['user'] = user
         update_user_status(user['id'], 1)  # Mark user as online
         return True
     else:
@@ -107,12 +118,67 @@ def logout():
 def is_valid_email(email):
     return re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', email) is not None
 
+PROVISION_BATCH_SIZE = 500
+
+# Batch user creation from dicts with username, email, name and an optional
+# password. Passwords are hashed in parallel in the password pool and users are
+# inserted PROVISION_BATCH_SIZE per transaction. Returns (number created,
+# [(row number, reason skipped)], {username: generated temporary password}).
+def provision_users(rows):
+    skipped = []
+    valid = []
+    seen_usernames, seen_emails = set(), set()
+    for number, row in enumerate(rows, start=1):
+        username = (row.get('username') or '').strip()
+        email = (row.get('email') or '').strip()
+        name = (row.get('name') or '').strip()
+        if not (username and email and name):
+            skipped.append((number, "Missing username, email or name"))
+        elif not is_valid_email(email):
+            skipped.append((number, "Invalid email"))
+        elif username in seen_usernames or email in seen_emails:
+            skipped.append((number, "Duplicate in file"))
+        else:
+            seen_usernames.add(username)
+            seen_emails.add(email)
+            valid.append((number, username, email, name, (row.get('password') or '').strip()))
+
+    created = 0
+    temporary_passwords = {}
+    conn = get_db_connection()
+    try:
+        for start in range(0, len(valid), PROVISION_BATCH_SIZE):
+            batch = valid[start:start + PROVISION_BATCH_SIZE]
+            # Drop existing users before spending time hashing their passwords
+            placeholders = ', '.join('?' * len(batch))
+            existing = conn.execute(
+                f'SELECT username, email FROM users WHERE username IN ({placeholders}) OR email IN ({placeholders})',
+                [user[1] for user in batch] + [user[2] for user in batch]).fetchall()
+            taken = {row['username'] for row in existing} | {row['email'] for row in existing}
+            new_users = []
+            for number, username, email, name, password in batch:
+                if username in taken or email in taken:
+                    skipped.append((number, "User with this email or username already exists"))
+                    continue
+                if not password:
+                    password = temporary_passwords[username] = secrets.token_urlsafe(12)
+                new_users.append((username, email, name, password))
+
+            hashes = hash_passwords([user[3] for user in new_users])
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO users (username, password, email, name) VALUES (?, ?, ?, ?)',
+                             [(username, pwhash, email, name)
+                              for (username, email, name, _), pwhash in zip(new_users, hashes)])
+            conn.commit()
+            created += conn.total_changes - before
+    finally:
+        conn.close()
+    return created, skipped, temporary_passwords
+
 def register():
     st.header("Register")
     with st.form("register_form"):
-        conn = get_db_connection()
-        if conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0:
-            conn.close()
+        if user_count() == 0:
             username = st.text_input("Username")
             email = st.text_input("Email")
             name = st.text_input("Name")
@@ -144,10 +210,8 @@ def register():
             
                 if password == confirm_password:
                     # If no token is provided and the user count is zero, skip token validation
-                    conn = get_db_connection()
-                    if token or (conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] > 0):
+                    if token or user_count() > 0:
                         register_user(username, password, email, name, token)
-                        conn.close()
                     else:
                         st.error("A registration token is required.")
                 else:
@@ -161,12 +225,10 @@ def login():
         password = st.text_input("Password", type="password")
         submit_button = st.form_submit_button("Login")
         
-        if submit_button:
-            if login_user(username, password):
-                st.success("Login successful!")
-                st.rerun()
-            else:
-                st.error("Invalid credentials.")
+        # login_user reports its own errors, including throttled attempts
+        if submit_button and login_user(username, password):
+            st.success("Login successful!")
+            st.rerun()
 
 # Home page
 def home():
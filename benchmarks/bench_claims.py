@@ -0,0 +1,101 @@
+"""Dropped-task claiming under contention.
+
+Seeds a scratch database with unassigned global tasks and has many threads
+claim them at once, either one at a time with todo.claim_task() or in batches
+with todo.claim_next_tasks(). Every task must end up with exactly one owner;
+the script reports claims/second, how many claims lost a race and how many
+hit "database is locked".
+
+    python -m benchmarks.bench_claims --tasks 2000 --claimers 1 8 32 --batch 1 10
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import todo
+
+
+def seed(tasks):
+    conn = db.get_db_connection()
+    conn.execute('DELETE FROM tasks')
+    conn.executemany('INSERT INTO tasks (user_id, task, is_done, is_global, task_id) VALUES (NULL, ?, 0, 1, ?)',
+                     [(f"Task {i}", 100000 + i) for i in range(tasks)])
+    conn.commit()
+    ids = [row['id'] for row in conn.execute('SELECT id FROM tasks ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def run(claimers, batch, ids):
+    counts = Counter()
+    lock = threading.Lock()
+    claimed = []
+
+    def claimer(user_id):
+        mine, lost, locked = [], 0, 0
+        if batch == 1:
+            # Everyone walks the same list, so most attempts race for a task
+            # somebody else is claiming at the same moment.
+            for task_id in ids:
+                try:
+                    if todo.claim_task(task_id, user_id):
+                        mine.append(task_id)
+                    else:
+                        lost += 1
+                except sqlite3.OperationalError:
+                    locked += 1
+        else:
+            while True:
+                try:
+                    got = todo.claim_next_tasks(user_id, batch)
+                except sqlite3.OperationalError:
+                    locked += 1
+                    continue
+                if not got:
+                    break
+                mine.extend(got)
+        with lock:
+            claimed.extend(mine)
+            counts.update(lost=lost, locked=locked)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=claimers) as executor:
+        list(executor.map(claimer, range(1, claimers + 1)))
+    elapsed = time.perf_counter() - start
+
+    duplicates = len(claimed) - len(set(claimed))
+    conn = db.get_db_connection()
+    unassigned = conn.execute('SELECT COUNT(*) FROM tasks WHERE user_id IS NULL').fetchone()[0]
+    conn.close()
+    assert duplicates == 0, f"{duplicates} tasks claimed twice"
+    assert unassigned == 0 and len(claimed) == len(ids), "some tasks were never claimed"
+    return len(claimed) / elapsed, counts['lost'], counts['locked']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--claimers', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 10])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_db_path(os.path.join(tmp, 'bench.db'))
+        db.init_db()
+        print(f"{'batch':>6}{'threads':>8}{'claims/s':>12}{'lost':>8}{'locked':>8}")
+        for batch in args.batch:
+            for claimers in args.claimers:
+                ids = seed(args.tasks)
+                rate, lost, locked = run(claimers, batch, ids)
+                print(f"{batch:>6}{claimers:>8}{rate:>12.1f}{lost:>8}{locked:>8}")
+        db.close_all()
+
+
+if __name__ == '__main__':
+    main()
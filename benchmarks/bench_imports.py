@@ -0,0 +1,92 @@
+"""Import cost of the login screen and of each page.
+
+Runs `python -X importtime` in a fresh interpreter for the login screen
+(`import app`) and for every page in app.PAGES (`import app, <page module>`),
+and reports the total import time and the modules each one loads. Fails when
+a scenario imports one of DEFERRED (they should only load when a link import
+actually runs) or when its median got slower than the stored baseline allows.
+
+    python -m benchmarks.bench_imports
+    python -m benchmarks.bench_imports --save-baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from app import PAGES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_imports.json')
+DEFERRED = ('requests', 'bs4', 'fetcher')
+
+
+def import_profile(modules):
+    # Returns (total import time in ms, names of every module imported)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    total = 0
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        loaded.add(name.strip())
+    return total / 1000, loaded
+
+
+def scenarios():
+    yield 'login', ['app']
+    for name, (module, _, _) in PAGES.items():
+        yield name, ['app', module]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown, as a fraction")
+    parser.add_argument('--min-delta', type=float, default=20.0, help="ignore slowdowns under this many ms")
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    import_profile(['app'])  # warm the OS file cache
+    print(f"{'scenario':<14}{'median ms':>10}{'modules':>9}{'base ms':>9}{'change':>9}  deferred loaded")
+    for name, modules in scenarios():
+        runs = [import_profile(modules) for _ in range(args.repeat)]
+        median = statistics.median(total for total, _ in runs)
+        loaded = runs[0][1]
+        eager = [module for module in DEFERRED if module in loaded]
+        results[name] = round(median, 1)
+        base = baseline.get(name)
+        change = ''
+        if base:
+            change = f"{(median / base - 1) * 100:+.0f}%"
+            if median > base * (1 + args.tolerance) and median - base > args.min_delta:
+                failures.append(f"{name} is slower than the baseline")
+                change += ' !'
+        if eager:
+            failures.append(f"{name} imports {', '.join(eager)}")
+        print(f"{name:<14}{median:>10.1f}{len(loaded):>9}{base or '-':>9}{change:>9}  {', '.join(eager) or '-'}")
+
+    if args.save_baseline:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline saved to {os.path.relpath(BASELINE, ROOT)}")
+    if failures:
+        print('\n'.join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Login throughput under concurrency.
+
+Runs auth.authenticate() from many threads against a scratch database and
+reports logins/second and latency percentiles, with hashing done inline on the
+calling threads (the old behaviour) and through the passwords process pool.
+
+    python -m benchmarks.bench_login --concurrency 1 4 16 --logins 64
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash
+
+import auth
+import db
+import passwords
+
+
+def seed(users):
+    conn = db.get_db_connection()
+    hashes = passwords.hash_passwords([f"password{i}" for i in range(users)])
+    conn.executemany('INSERT INTO users (username, password, email, name) VALUES (?, ?, ?, ?)',
+                     [(f"user{i}", hashes[i], f"user{i}@example.com", f"User {i}") for i in range(users)])
+    conn.commit()
+    conn.close()
+
+
+def run(concurrency, logins, users):
+    def login(i):
+        start = time.perf_counter()
+        assert auth.authenticate(f"user{i % users}", f"password{i % users}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return logins / elapsed, statistics.median(latencies), p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--method', default=passwords.HASH_METHOD)
+    args = parser.parse_args()
+
+    passwords.HASH_METHOD = args.method
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_db_path(os.path.join(tmp, 'bench.db'))
+        db.init_db()
+        seed(args.users)
+
+        pooled_verify = passwords.verify_password
+        modes = {'inline': lambda pwhash, password: check_password_hash(pwhash, password),
+                 'pool': pooled_verify}
+        print(f"{'mode':<8}{'threads':>8}{'logins/s':>12}{'p50 ms':>10}{'p95 ms':>10}")
+        for mode, verify in modes.items():
+            auth.verify_password = verify
+            for concurrency in args.concurrency:
+                rate, p50, p95 = run(concurrency, args.logins, args.users)
+                print(f"{mode:<8}{concurrency:>8}{rate:>12.1f}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}")
+        auth.verify_password = pooled_verify
+        db.close_all()
+    passwords.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Per-page data path and render timings on synthetic data.
+
+For each scale in benchmarks.seed.SCALES this builds (or reuses) a seeded
+database, times the queries behind every page and then renders each page
+headlessly through Streamlit's AppTest as the admin user. Results are p50/p95
+in milliseconds, compared against the stored baseline; anything whose p50 got
+slower than the tolerance allows (and by more than --min-delta, so sub-ms noise
+is ignored) is flagged and the exit status is 1.
+
+    python -m benchmarks.bench_pages --scales small medium
+    python -m benchmarks.bench_pages --scales small medium --save-baseline
+
+Generated databases are kept in .bench_data/ and reused while the seed and
+schema version match. Baselines are only comparable on the same machine.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from streamlit.runtime.scriptrunner_utils import script_run_context
+from streamlit.testing.v1 import AppTest
+
+import admin
+import attachments
+import db
+import group_chat
+import notes
+import todo
+import user_directory
+from benchmarks import seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, '.bench_data')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_pages.json')
+ADMIN = {'id': 1, 'username': 'user1', 'name': 'User 1', 'is_admin': 1, 'job_profile': '', 'github': '', 'discord': ''}
+PAGES = ["Profile", "Notes", "To-Do List", "Group Chats", "Admin Panel"]
+
+
+def database(scale, seed_value):
+    path = os.path.join(DATA_DIR, f"{scale}-{seed_value}-v{len(db.MIGRATIONS)}.db")
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        print(f"generating {scale} data...", file=sys.stderr)
+        seed.build(path + '.tmp', scale, seed_value)
+        db.close_all()
+        os.replace(path + '.tmp', path)
+    db.set_db_path(path)
+    user_directory.invalidate()
+    return path
+
+
+def query_cases(conn):
+    # Parameters are picked from the data so deep pages and searches hit rows
+    busiest = conn.execute('SELECT chat_id FROM messages GROUP BY chat_id ORDER BY COUNT(*) DESC LIMIT 1').fetchone()[0]
+    middle = conn.execute('''
+        SELECT timestamp, id FROM messages WHERE chat_id = ?
+        ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM messages WHERE chat_id = ?)
+    ''', (busiest, busiest)).fetchone()
+    last_id = conn.execute('SELECT MAX(id) FROM messages').fetchone()[0]
+    note_ids = [row['id'] for row in notes.list_notes(conn, 1)]
+    today = date.today()
+    return {
+        'chat.latest_page': lambda: group_chat.get_messages_page(conn, busiest, 10),
+        'chat.deep_page': lambda: group_chat.get_messages_page(conn, busiest, 10, tuple(middle)),
+        'chat.poll_idle': lambda: group_chat.get_new_messages(conn, busiest, last_id),
+        'chat.search': lambda: group_chat.search_messages(conn, 'release incident'),
+        'chat.search_in_chat': lambda: group_chat.search_messages(conn, 'deploy', chat_id=busiest),
+        'chat.jump_window': lambda: group_chat.get_message_window(conn, busiest, middle['id']),
+        'notes.list': lambda: notes.list_notes(conn, 1),
+        'notes.attachments': lambda: attachments.list_for_notes(conn, note_ids),
+        'notes.search': lambda: notes.search_notes(conn, 1, 'roadmap budget'),
+        'todo.board_open': lambda: todo.get_task_board(conn, 0),
+        'todo.board_done': lambda: todo.get_task_board(conn, 1),
+        'todo.board_user': lambda: todo.get_task_board(conn, 0, assignee=2),
+        'todo.board_due_week': lambda: todo.get_task_board(conn, 0, due_from=today, due_to=today + timedelta(days=7)),
+        'admin.find_users': lambda: admin.find_users(conn, 'user12'),
+        'admin.find_tokens': lambda: admin.find_tokens(conn),
+        'directory.load': lambda: (user_directory.invalidate(), user_directory.get_users()),
+        'directory.search': lambda: user_directory.search('engineer'),
+    }
+
+
+def render_cases():
+    def render(page):
+        def case():
+            at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=120)
+            at.session_state['user'] = dict(ADMIN)
+            at.run()
+            start = time.perf_counter()
+            at.sidebar.selectbox[0].set_value(page).run()
+            elapsed = time.perf_counter() - start
+            assert not at.exception, [e.message for e in at.exception]
+            return elapsed
+        return case
+    return {f"render.{page}": render(page) for page in PAGES}
+
+
+def measure(fn, repeat, timed_by_case=False):
+    fn()  # warm caches and the statement cache
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(result if timed_by_case else time.perf_counter() - start)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples) * 1000, p95 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', nargs='+', choices=seed.SCALES, default=['small', 'medium'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--render-repeat', type=int, default=3)
+    parser.add_argument('--no-render', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p50 slowdown, as a fraction")
+    parser.add_argument('--min-delta', type=float, default=1.0, help="ignore p50 slowdowns under this many ms")
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    # AppTest resets log levels and warns about the missing script run context
+    # on every run, which would drown the table
+    script_run_context._LOGGER.disabled = True
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print(f"{'case':<34}{'p50 ms':>10}{'p95 ms':>10}{'base p50':>10}{'change':>9}")
+    for scale in args.scales:
+        database(scale, args.seed)
+        conn = db.get_db_connection()
+        cases = {name: (fn, args.repeat, False) for name, fn in query_cases(conn).items()}
+        if not args.no_render:
+            cases.update((name, (fn, args.render_repeat, True)) for name, fn in render_cases().items())
+        for name, (fn, repeat, timed_by_case) in cases.items():
+            key = f"{scale}/{name}"
+            p50, p95 = measure(fn, repeat, timed_by_case)
+            results[key] = {'p50': round(p50, 3), 'p95': round(p95, 3)}
+            base = baseline.get(key)
+            change = ''
+            if base:
+                ratio = p50 / base['p50'] if base['p50'] else 1.0
+                change = f"{(ratio - 1) * 100:+.0f}%"
+                if ratio > 1 + args.tolerance and p50 - base['p50'] > args.min_delta:
+                    regressions.append(key)
+                    change += ' !'
+            print(f"{key:<34}{p50:>10.2f}{p95:>10.2f}{base['p50'] if base else '-':>10}{change:>9}")
+        conn.close()
+    db.close_all()
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline saved to {os.path.relpath(BASELINE, ROOT)}")
+    elif regressions:
+        print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Concurrent sessions load test.
+
+Drives N simulated users at once through app.py with Streamlit's AppTest.
+Every session logs in, then repeatedly opens Group Chats and sends a message,
+opens Notes, and picks up dropped tasks. Reports actions/second, latency
+percentiles per action and how many actions failed, separating "database is
+locked" errors.
+
+AppTest swaps process-wide Streamlit state on every run, so it can't drive two
+sessions from threads of one process; each session gets its own process
+instead. That means each has its own connection pool and write queue, as if
+every user had a server process to themselves, which makes this a
+pessimistic test of locking.
+
+    python -m benchmarks.load_test --sessions 1 8 32 --iterations 5
+    python -m benchmarks.load_test --db database.db --sessions 16
+
+The database is created with benchmarks.seed at --scale when the path doesn't
+exist yet; without --db a scratch database is used. Simulated users are user2
+onwards with the password "password", so point --db at a copy of a real
+database only if it has such users.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from streamlit.runtime.scriptrunner_utils import script_run_context
+from streamlit.testing.v1 import AppTest
+
+import db
+import passwords
+from benchmarks import seed
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+ACTIONS = ['login', 'open_chat', 'send_message', 'open_notes', 'open_todo', 'open_dropped', 'claim_tasks']
+
+
+class Session:
+    def __init__(self, user_number):
+        self.username = f"user{user_number}"
+        self.samples = []
+        self.at = AppTest.from_file(APP, default_timeout=120)
+
+    def act(self, name, step):
+        start = time.perf_counter()
+        try:
+            step()
+            errors = [e.message for e in self.at.exception]
+        except Exception as e:
+            errors = [f"{type(e).__name__}: {e}"]
+        self.samples.append((name, time.perf_counter() - start, errors))
+        return not errors
+
+    def navigate(self, page):
+        self.at.sidebar.selectbox[0].set_value(page).run()
+
+    def send(self, message):
+        self.at.text_area[0].set_value(message)
+        next(button for button in self.at.button if button.label == "Send").click().run()
+
+    def pick_tab(self, tab):
+        next(box for box in self.at.selectbox if box.label == "Select Tab").set_value(tab).run()
+
+    def login(self):
+        def step():
+            self.at.run()
+            self.at.text_input[0].set_value(self.username)
+            self.at.text_input[1].set_value('password')
+            self.at.button[0].click().run()
+            if 'user' not in self.at.session_state:
+                raise RuntimeError(f"login failed for {self.username}")
+        return self.act('login', step)
+
+    def iteration(self, i):
+        self.act('open_chat', lambda: self.navigate("Group Chats"))
+        self.act('send_message', lambda: self.send(f"load test {self.username} {i}"))
+        self.act('open_notes', lambda: self.navigate("Notes"))
+        self.act('open_todo', lambda: self.navigate("To-Do List"))
+        self.act('open_dropped', lambda: self.pick_tab("Dropped Work"))
+        self.act('claim_tasks', lambda: self.at.button(key="claim_next").click().run())
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.locked = 0
+        self.examples = {}
+
+    def record(self, name, elapsed, errors):
+        self.latencies[name].append(elapsed)
+        if errors:
+            self.errors[name] += 1
+            self.examples.setdefault(name, errors[0])
+            if any('database is locked' in error for error in errors):
+                self.locked += 1
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def user(path, number, iterations, barrier, results):
+    # AppTest resets log levels and warns about the missing script run context
+    # on every run, which would drown the report
+    script_run_context._LOGGER.disabled = True
+    db.set_db_path(path)
+    session = Session(number)
+    barrier.wait()
+    if session.login():
+        for i in range(iterations):
+            session.iteration(i)
+    results.put(session.samples)
+    db.close_all()
+    passwords.shutdown()
+
+
+def run(path, sessions, iterations, first_user):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(sessions + 1)
+    results = context.Queue()
+    processes = [context.Process(target=user, args=(path, first_user + n, iterations, barrier, results))
+                 for n in range(sessions)]
+    for process in processes:
+        process.start()
+    # Start the clock once every session has finished importing
+    barrier.wait()
+    start = time.perf_counter()
+    stats = Stats()
+    for _ in processes:
+        for sample in results.get():
+            stats.record(*sample)
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    return stats, elapsed
+
+
+def report(sessions, stats, elapsed):
+    total = sum(len(samples) for samples in stats.latencies.values())
+    failed = sum(stats.errors.values())
+    print(f"\n{sessions} sessions: {total} actions in {elapsed:.1f}s, {total / elapsed:.1f} actions/s, "
+          f"{failed} failed ({failed / total:.1%}), {stats.locked} database is locked ({stats.locked / total:.1%})")
+    print(f"{'action':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    for name in ACTIONS:
+        samples = sorted(stats.latencies.get(name, []))
+        if not samples:
+            continue
+        print(f"{name:<14}{len(samples):>7}{statistics.median(samples) * 1000:>10.1f}"
+              f"{percentile(samples, 0.95) * 1000:>10.1f}{percentile(samples, 0.99) * 1000:>10.1f}"
+              f"{samples[-1] * 1000:>10.1f}{stats.errors.get(name, 0):>8}")
+    for name, error in stats.examples.items():
+        print(f"  first {name} error: {error.splitlines()[0][:160]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help="database to run against; seeded first if it doesn't exist")
+    parser.add_argument('--scale', choices=seed.SCALES, default='small')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, 'load.db')
+        if not os.path.exists(path):
+            print(f"seeding {args.scale} data into {path}...", file=sys.stderr)
+            seed.build(path, args.scale)
+        db.set_db_path(path)
+        db.init_db()
+        conn = db.get_db_connection()
+        users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        conn.close()
+        db.close_all()
+        # Each level logs in fresh users, so rate limits and rehash-on-login
+        # behave as they would for real first logins
+        first_user = 2
+        for sessions in args.sessions:
+            if first_user + sessions - 1 > users:
+                first_user = 2
+            stats, elapsed = run(path, sessions, args.iterations, first_user)
+            report(sessions, stats, elapsed)
+            first_user += sessions
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Query-plan regression check.
+
+Runs EXPLAIN QUERY PLAN against a freshly migrated scratch database for every
+SQL string literal in the app modules, plus representative calls of the
+functions that build SQL dynamically (f-strings are only covered through those
+calls, so new SQL builders belong in dynamic_statements()). Fails if any
+statement reads a whole table that isn't listed in ALLOWED_SCANS, or if a
+full-text MATCH query's plan doesn't start from the FTS table; otherwise the
+index is probed once per row of the other table.
+
+    python -m benchmarks.query_plans [-v]
+"""
+import argparse
+import ast
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import date
+from unittest import mock
+
+import db
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['todo.py', 'notes.py', 'group_chat.py', 'admin.py', 'auth.py', 'prof.py',
+           'presence.py', 'user_directory.py', 'attachments.py']
+SQL_START = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\s')
+TABLE_SCAN = re.compile(r'^SCAN (\w+)(?!.*VIRTUAL TABLE)')
+FTS_FIRST = re.compile(r'^SCAN \w+_fts VIRTUAL TABLE')
+
+# Statements expected to read a whole table, matched by substring, and why
+ALLOWED_SCANS = {
+    'SELECT COUNT(*) FROM users': "first-user check on the registration form",
+    'SELECT * FROM chats': "the chat picker lists every chat",
+    'FROM tokens WHERE 1 ': "CSV export of all tokens",
+    'FROM users ORDER BY id': "the user directory loads every user",
+}
+
+
+class ExplainConnection:
+    # Stands in for a connection: explains each statement instead of running it
+    db_path = None
+    total_changes = 0
+
+    def __init__(self, conn, record):
+        self._conn = conn
+        self._record = record
+        self._dirty = set()
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute(self, sql, params=()):
+        self._record(sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        for params in seq_of_params:
+            self._record(sql, params)
+            break
+        return self
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def __iter__(self):
+        return iter(())
+
+
+def literal_statements():
+    for module in MODULES:
+        with open(os.path.join(ROOT, module), encoding='utf-8') as f:
+            tree = ast.parse(f.read(), module)
+        # Pieces of f-strings are covered by dynamic_statements() instead
+        fragments = {id(part) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for part in node.values}
+        for node in ast.walk(tree):
+            if id(node) not in fragments and isinstance(node, ast.Constant) and isinstance(node.value, str) and SQL_START.match(node.value):
+                yield f"{module}:{node.lineno}", node.value, None
+
+
+def dynamic_statements():
+    import admin
+    import attachments
+    import auth
+    import group_chat
+    import notes
+    import todo
+    import user_directory
+
+    # For functions that open their own connection and hash passwords
+    def own_connection(module, call):
+        def run(conn):
+            with mock.patch.object(module, 'get_db_connection', lambda: conn), \
+                    mock.patch.object(module, 'hash_passwords', lambda passwords: ['hash'] * len(passwords), create=True):
+                call()
+        return run
+
+    calls = {
+        'admin.find_users': lambda conn: admin.find_users(conn, 'ann', 'Admins', 10),
+        'admin.find_tokens': lambda conn: admin.find_tokens(conn, 'Unused', 10),
+        'admin.tokens_csv': lambda conn: admin.tokens_csv(conn),
+        'admin.apply_bulk_action (delete)': own_connection(admin, lambda: admin.apply_bulk_action("Delete", [2, 3])),
+        'admin.apply_bulk_action (reset)': own_connection(admin, lambda: admin.apply_bulk_action("Reset Password", [2, 3])),
+        'auth.provision_users': own_connection(auth, lambda: auth.provision_users(
+            [{'username': 'ann', 'email': 'ann@example.com', 'name': 'Ann', 'password': 'secret'}])),
+        'user_directory._load': own_connection(user_directory, user_directory._load),
+        'attachments.list_for_notes': lambda conn: attachments.list_for_notes(conn, [1, 2, 3]),
+        'group_chat.search_messages': lambda conn: group_chat.search_messages(
+            conn, 'release', chat_id=1, author_id=2, since=date(2024, 1, 1), until=date(2024, 2, 1)),
+        'notes.search_notes': lambda conn: notes.search_notes(conn, 1, 'release'),
+        'todo.get_task_board (open, everyone)': lambda conn: todo.get_task_board(conn, 0, after=('2024-01-01', 1)),
+        'todo.get_task_board (done, assignee)': lambda conn: todo.get_task_board(conn, 1, assignee=1),
+        'todo.get_task_board (due range)': lambda conn: todo.get_task_board(
+            conn, 0, due_from=date(2024, 1, 1), due_to=date(2024, 2, 1)),
+    }
+    for name, call in calls.items():
+        recorded = []
+        call(ExplainConnection(None, lambda sql, params: recorded.append((sql, params))))
+        for sql, params in recorded:
+            yield name, sql, params
+
+
+def explain(conn, sql, params):
+    if params is None:
+        params = [None] * sql.count('?')
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-v', '--verbose', action='store_true', help="print every plan")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_db_path(os.path.join(tmp, 'plans.db'))
+        db.init_db()
+        conn = db.get_db_connection()
+        statements = list(literal_statements()) + list(dynamic_statements())
+        for where, sql, params in statements:
+            statement = ' '.join(sql.split())
+            try:
+                plan = explain(conn, sql, params)
+            except sqlite3.Error as e:
+                print(f"ERROR {where}: {e}\n    {statement}")
+                failures += 1
+                continue
+            scans = [detail for detail in plan if TABLE_SCAN.match(detail)]
+            allowed = any(pattern in statement for pattern in ALLOWED_SCANS)
+            problem = None
+            if scans and not allowed:
+                problem = "FULL SCAN"
+            elif ' MATCH ' in statement and not (plan and FTS_FIRST.match(plan[0])):
+                problem = "FTS NOT DRIVING"
+            if problem:
+                failures += 1
+                print(f"{problem} {where}\n    {statement}")
+                for detail in plan:
+                    print(f"    | {detail}")
+            elif args.verbose:
+                print(f"ok {where}{' (allowed scan)' if scans else ''}\n    {statement}")
+                for detail in plan:
+                    print(f"    | {detail}")
+        conn.close()
+        db.close_all()
+
+    print(f"{len(statements)} statements checked, {failures} failing")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Seeded synthetic data for benchmarks.
+
+Fills a database with users, chats and messages, notes with attachments and
+tasks at one of the SCALES below. The same seed always produces the same data,
+so timings from different runs are comparable. User 1 is an admin with the
+password "password".
+
+    python -m benchmarks.seed --scale medium --db /tmp/medium.db
+"""
+import argparse
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import db
+
+SCALES = {
+    'small': dict(users=100, chats=10, messages=10_000, notes=1_000, tasks=2_000),
+    'medium': dict(users=1_000, chats=50, messages=100_000, notes=10_000, tasks=20_000),
+    'large': dict(users=10_000, chats=200, messages=1_000_000, notes=100_000, tasks=200_000),
+}
+BATCH_SIZE = 10_000
+ATTACHMENT_RATE = 0.2
+DISTINCT_ATTACHMENTS = 64
+
+WORDS = ('deploy review sprint backlog release meeting design bug fix feature database query index cache '
+         'login profile chat note task deadline report metrics latency python streamlit sqlite docs '
+         'frontend backend api token admin schedule demo budget roadmap hiring onboarding incident').split()
+JOBS = ['Engineer', 'Designer', 'Product Manager', 'Data Scientist', 'Intern', 'Support', None]
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert(conn, sql, rows):
+    for batch in batches(rows):
+        conn.executemany(sql, batch)
+
+
+def populate(conn, users, chats, messages, notes, tasks, seed=0):
+    rng = random.Random(seed)
+    # Hashing each password properly would dominate the run; one cheap hash is
+    # shared by everyone and gets upgraded on first login like any old hash.
+    password = generate_password_hash('password', method='pbkdf2:sha256:1000')
+    now = datetime.now()
+
+    insert(conn, '''
+        INSERT INTO users (id, username, password, email, name, job_profile, github, discord, is_admin, is_original_admin)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', ((i, f"user{i}", password, f"user{i}@example.com", f"User {i}", rng.choice(JOBS),
+           f"https://github.com/user{i}", f"user{i}#{i % 10000:04d}", int(i == 1), int(i == 1))
+          for i in range(1, users + 1)))
+
+    insert(conn, 'INSERT INTO chats (id, name, created_by) VALUES (?, ?, ?)',
+           ((i, f"chat-{i}", rng.randint(1, users)) for i in range(1, chats + 1)))
+
+    # Chat sizes are skewed: the first chat gets about a third of all traffic
+    start = now - timedelta(days=365)
+    step = timedelta(days=365) / max(messages, 1)
+    insert(conn, 'INSERT INTO messages (chat_id, user_id, message, timestamp) VALUES (?, ?, ?, ?)',
+           ((1 if rng.random() < 0.33 else rng.randint(1, chats), rng.randint(1, users), sentence(rng, 3, 20),
+             (start + step * i).strftime('%Y-%m-%d %H:%M:%S')) for i in range(messages)))
+
+    insert(conn, 'INSERT INTO notes (id, user_id, title, content, is_global, is_pinned) VALUES (?, ?, ?, ?, ?, ?)',
+           ((i, rng.randint(1, users), sentence(rng, 2, 6), sentence(rng, 20, 120),
+             int(rng.random() < 0.005), int(rng.random() < 0.05)) for i in range(1, notes + 1)))
+
+    blobs = []
+    for i in range(DISTINCT_ATTACHMENTS):
+        data = rng.randbytes(rng.randint(1024, 64 * 1024))
+        digest = hashlib.sha256(data).hexdigest()
+        conn.execute('INSERT OR IGNORE INTO attachments (hash, size, data) VALUES (?, ?, ?)', (digest, len(data), data))
+        blobs.append((digest, len(data), f"file{i}.bin"))
+    insert(conn, 'INSERT INTO note_attachments (note_id, hash, name, mime, size) VALUES (?, ?, ?, ?, ?)',
+           ((note_id, digest, name, 'application/octet-stream', size)
+            for note_id in range(1, notes + 1) if rng.random() < ATTACHMENT_RATE
+            for digest, size, name in [rng.choice(blobs)]))
+
+    # About 5% of tasks are dropped (global and unassigned), a third are done
+    def task(i):
+        dropped = rng.random() < 0.05
+        deadline = (now + timedelta(days=rng.randint(-60, 60))).strftime('%Y-%m-%d')
+        return (None if dropped else rng.randint(1, users), sentence(rng, 3, 10),
+                int(not dropped and rng.random() < 0.33), int(dropped), deadline, rng.randint(100000, 999999))
+    insert(conn, 'INSERT INTO tasks (user_id, task, is_done, is_global, deadline, task_id) VALUES (?, ?, ?, ?, ?, ?)',
+           (task(i) for i in range(tasks)))
+
+
+def build(path, scale, seed=0):
+    db.set_db_path(path)
+    db.init_db()
+    conn = db.get_db_connection()
+    try:
+        conn.execute('BEGIN')
+        populate(conn, seed=seed, **SCALES[scale])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', required=True)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build(args.db, args.scale, args.seed)
+    db.close_all()
+    print(f"{args.scale} data written to {args.db} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,161 @@
+import os
+import queue
 import sqlite3
+import threading
+import time
 
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
+import attachments
+import metrics
+import query_cache
+
+DB_PATH = os.environ.get('DASHBOARD_DB_PATH', 'database.db')
+POOL_SIZE = int(os.environ.get('DASHBOARD_DB_POOL_SIZE', '8'))
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+)
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+class TracedCursor(sqlite3.Cursor):
+    # Times each statement up to its first result row and counts the rows
+    # fetched afterwards, under the statement's label in metrics.
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._label = metrics.statement_label(sql)
+            metrics.observe('query', self._label, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._label = metrics.statement_label(sql)
+            metrics.observe('query', self._label, time.perf_counter() - start)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            metrics.add_rows(self._label, 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        metrics.add_rows(self._label, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        metrics.add_rows(self._label, len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        metrics.add_rows(self._label, 1)
+        return row
+
+
+class PooledConnection(sqlite3.Connection):
+    # Statements run through a TracedCursor unless tracing is switched off.
+    # The C execute shortcuts don't call cursor(), so they're redone here.
+    def cursor(self, factory=None):
+        if factory is None and metrics.TRACE_QUERIES:
+            factory = TracedCursor
+        return super().cursor(factory or sqlite3.Cursor)
+
+    def execute(self, sql, parameters=()):
+        self._dirty |= query_cache.written_tables(sql)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._dirty |= query_cache.written_tables(sql)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    # Tables written in this transaction are reported to the query cache once
+    # the commit has landed, never before, so no reader can cache old rows
+    # under the new generation.
+    def commit(self):
+        super().commit()
+        if self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            query_cache.bump(dirty)
+
+    def rollback(self):
+        super().rollback()
+        self._dirty = set()
+
+    # close() hands the connection back to the pool instead of closing it,
+    # so the existing "open, run, close" call sites keep working unchanged.
+    def close(self):
+        if self._pooled:
+            return
+        if self.in_transaction:
+            self.rollback()
+        elif self._dirty:
+            # Statements outside a transaction (DDL) have already landed
+            query_cache.bump(self._dirty)
+            self._dirty = set()
+        self._pooled = True
+        try:
+            _pool.put_nowait(self)
+        except queue.Full:
+            super().close()
+
+    def dispose(self):
+        self._pooled = True
+        super().close()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, factory=PooledConnection, check_same_thread=False,
+                           timeout=5.0, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    conn._dirty = set()
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    conn.db_path = path
     return conn
 
-def init_db():
-    conn = get_db_connection()
 
+def get_db_connection():
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _connect(DB_PATH)
+            break
+        if conn.db_path == DB_PATH:
+            break
+        conn.dispose()
+    conn._pooled = False
+    return conn
+
+
+def set_db_path(path):
+    global DB_PATH
+    DB_PATH = path
+    close_all()
+
+
+def close_all():
+    while True:
+        try:
+            _pool.get_nowait().dispose()
+        except queue.Empty:
+            return
+
+
+# Migration 1: the original schema. Uses IF NOT EXISTS so databases created
+# before migrations existed (user_version 0) adopt it without changes.
+def _initial_schema(conn):
     # Users table
     conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -99,6 +247,198 @@ def init_db():
             FOREIGN KEY (created_by) REFERENCES users (id)
         )
     ''')
-    
-    conn.commit()
-    conn.close()
+
+
+# Migration 2: keyset pagination of chat history walks this index newest-first
+def _messages_chat_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_timestamp ON messages (chat_id, timestamp)')
+
+
+# Migration 3: content-addressed attachment store, replacing the pickled list
+# of file bytes in notes.files. Existing pickled rows are moved across.
+def _attachment_store(conn):
+    import pickle
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attachments (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS note_attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            note_id INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mime TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            FOREIGN KEY (note_id) REFERENCES notes (id),
+            FOREIGN KEY (hash) REFERENCES attachments (hash)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_note_attachments_note ON note_attachments (note_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_note_attachments_hash ON note_attachments (hash)')
+
+    rows = conn.execute('SELECT id FROM notes WHERE files IS NOT NULL').fetchall()
+    for row in rows:
+        # One note at a time so only a single pickled list is held in memory
+        blob = conn.execute('SELECT files FROM notes WHERE id = ?', (row['id'],)).fetchone()['files']
+        for i, data in enumerate(pickle.loads(blob)):
+            attachments.attach(conn, row['id'], f"file_{i + 1}", None, data)
+        conn.execute('UPDATE notes SET files = NULL WHERE id = ?', (row['id'],))
+
+
+# Migration 4: full-text index over note titles and content. It is an
+# external-content FTS5 table kept in sync with notes by triggers.
+def _notes_fts(conn):
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts
+        USING fts5(title, content, content='notes', content_rowid='id')
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF title, content ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO notes_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+    ''')
+    conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+
+
+# Migration 5: full-text index over chat messages, same scheme as notes_fts
+def _messages_fts(conn):
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+        USING fts5(message, content='messages', content_rowid='id')
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message) VALUES (new.id, new.message);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', old.id, old.message);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF message ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', old.id, old.message);
+            INSERT INTO messages_fts (rowid, message) VALUES (new.id, new.message);
+        END
+    ''')
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+# Migration 6: heartbeat presence replaces users.is_online and the unused
+# user_status table
+def _presence(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS presence (
+            user_id INTEGER PRIMARY KEY,
+            last_seen REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_presence_last_seen ON presence (last_seen)')
+    conn.execute('DROP TABLE IF EXISTS user_status')
+    conn.execute('UPDATE users SET is_online = 0 WHERE is_online != 0')
+
+
+# Migration 7: live chat polling seeks messages by (chat_id, id)
+def _messages_chat_id_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id, id)')
+
+
+# Migration 8: token listing filters on is_used
+def _tokens_is_used_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tokens_is_used ON tokens (is_used)')
+
+
+# Migration 9: indexes for the remaining hot filters (see
+# benchmarks/query_plans.py, which fails on unexpected full table scans)
+def _hot_query_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_done ON tasks (user_id, is_done)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_global_user ON tasks (is_global, user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_global_pinned ON notes (is_global, is_pinned)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_user_pinned ON notes (user_id, is_pinned)')
+
+
+# Migration 10: the task board orders by deadline within (assignee, status)
+# or within status alone; the first index supersedes idx_tasks_user_done
+def _task_board_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_done_deadline ON tasks (user_id, is_done, deadline)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_done_deadline ON tasks (is_done, deadline)')
+    conn.execute('DROP INDEX IF EXISTS idx_tasks_user_done')
+
+
+# Turn free text typed by a user into an FTS5 query: every word must match,
+# the last one as a prefix, and FTS5 operators in the input are taken literally.
+def fts_query(text):
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if not terms:
+        return None
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+# Ordered schema migrations; PRAGMA user_version records how many have been
+# applied. Only ever append to this list.
+MIGRATIONS = [
+    _initial_schema,
+    _messages_chat_index,
+    _attachment_store,
+    _notes_fts,
+    _messages_fts,
+    _presence,
+    _messages_chat_id_index,
+    _tokens_is_used_index,
+    _hot_query_indexes,
+    _task_board_indexes,
+]
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the lock
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= number:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def init_db():
+    # Runs the migrations once per process and database; later reruns return
+    # without touching the schema.
+    if DB_PATH in _migrated:
+        return
+    with _migrate_lock:
+        if DB_PATH in _migrated:
+            return
+        conn = get_db_connection()
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        _migrated.add(DB_PATH)
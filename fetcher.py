@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# HTTP fetching for "Import from Link": one pooled requests.Session shared by
+# every session in the process, bounded timeouts and response size, and an
+# on-disk cache revalidated with ETag / Last-Modified.
+
+CACHE_DIR = os.environ.get('DASHBOARD_HTTP_CACHE', '.http_cache')
+TIMEOUT = (5, 15)  # (connect, read) seconds
+MAX_RESPONSE_BYTES = int(os.environ.get('DASHBOARD_MAX_IMPORT_MB', '5')) * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+POOL_SIZE = 16
+MAX_WORKERS = 8
+PER_HOST_LIMIT = 2
+
+Page = namedtuple('Page', ['url', 'content', 'encoding', 'from_cache'])
+Result = namedtuple('Result', ['url', 'value', 'error'])
+
+
+class FetchError(Exception):
+    pass
+
+
+class ResponseTooLarge(FetchError):
+    pass
+
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = 'IRIS-Dashboard/1.0'
+            _session = session
+        return _session
+
+
+def _cache_paths(cache_dir, url):
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key + '.json'), os.path.join(cache_dir, key + '.body')
+
+def _read_cache(cache_dir, url):
+    meta_path, body_path = _cache_paths(cache_dir, url)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(body_path, 'rb') as f:
+            body = f.read()
+    except (OSError, ValueError):
+        return None, None
+    if meta.get('url') != url:
+        return None, None
+    return meta, body
+
+def _write_cache(cache_dir, url, meta, body):
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path, body_path = _cache_paths(cache_dir, url)
+    # Write to temporary files and rename so readers never see a partial entry
+    for path, data, mode in ((body_path, body, 'wb'), (meta_path, json.dumps(meta), 'w')):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+def _read_body(response, max_bytes):
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise ResponseTooLarge(f"Response is {length} bytes; the limit is {max_bytes} bytes.")
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            raise ResponseTooLarge(f"Response exceeds the limit of {max_bytes} bytes.")
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def fetch(url, session=None, cache_dir=CACHE_DIR, timeout=TIMEOUT, max_bytes=MAX_RESPONSE_BYTES):
+    session = session or get_session()
+    meta, cached_body = _read_cache(cache_dir, url) if cache_dir else (None, None)
+
+    headers = {}
+    if meta:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and meta:
+                return Page(url, cached_body, meta.get('encoding'), True)
+            response.raise_for_status()
+            body = _read_body(response, max_bytes)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            encoding = response.encoding
+    except requests.RequestException as e:
+        raise FetchError(str(e)) from e
+
+    if cache_dir and (etag or last_modified):
+        _write_cache(cache_dir, url, {'url': url, 'etag': etag, 'last_modified': last_modified,
+                                      'encoding': encoding}, body)
+    return Page(url, body, encoding, False)
+
+
+# Fetch many URLs on a bounded thread pool, with at most per_host requests in
+# flight to any one host. process(page) runs on the worker thread too, so
+# parsing happens off the caller's thread. Yields a Result per URL as each one
+# finishes; failures are reported in Result.error rather than raised.
+def fetch_many(urls, process=None, max_workers=MAX_WORKERS, per_host=PER_HOST_LIMIT, **fetch_args):
+    host_slots = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+    # Create every semaphore up front so worker threads only ever read the dict
+    for url in urls:
+        host_slots[urlsplit(url).netloc]
+
+    def work(url):
+        with host_slots[urlsplit(url).netloc]:
+            page = fetch(url, **fetch_args)
+        return process(page) if process else page
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(work, url): url for url in urls}
+        for future in as_completed(futures):
+            try:
+                yield Result(futures[future], future.result(), None)
+            except Exception as e:
+                yield Result(futures[future], None, e)
@@ -1,22 +1,165 @@
 import streamlit as st
-import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
+from db import get_db_connection, fts_query
+from user_directory import get_user_name, get_user_names
+import query_cache
+import writer
 
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+LIVE_REFRESH_SECONDS = 3
+LIVE_BUFFER_SIZE = 200
 
 def format_timestamp(timestamp):
     dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
     return dt.strftime('%d %b %H:%M')  # Day Month Time
 
+# Keyset pagination: "before" is the (timestamp, id) of the oldest message
+# already shown, so every page is an index seek regardless of chat length.
+def get_messages_page(conn, chat_id, limit, before=None):
+    if before is None:
+        return conn.execute('''
+            SELECT * FROM messages
+            WHERE chat_id = ?
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', (chat_id, limit)).fetchall()
+    return conn.execute('''
+        SELECT * FROM messages
+        WHERE chat_id = ? AND (timestamp, id) < (?, ?)
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    ''', (chat_id, before[0], before[1], limit)).fetchall()
+
+# Messages posted to a chat after after_id, oldest first. A rowid range seek,
+# so polling an idle chat returns no rows almost for free.
+def get_new_messages(conn, chat_id, after_id, limit=LIVE_BUFFER_SIZE):
+    return conn.execute('''
+        SELECT * FROM messages
+        WHERE chat_id = ? AND id > ?
+        ORDER BY id ASC
+        LIMIT ?
+    ''', (chat_id, after_id, limit)).fetchall()
+
+# Message search, newest hits first. chat_id/author_id of None search every
+# chat/author; since and until are dates (inclusive). The CROSS JOIN keeps the
+# FTS index driving the join; otherwise a chat filter makes SQLite walk the
+# whole chat and probe the index once per message.
+def search_messages(conn, text, chat_id=None, author_id=None, since=None, until=None, limit=50):
+    query = fts_query(text)
+    if query is None:
+        return []
+    conditions = ['messages_fts MATCH ?']
+    params = [query]
+    if chat_id is not None:
+        conditions.append('messages.chat_id = ?')
+        params.append(chat_id)
+    if author_id is not None:
+        conditions.append('messages.user_id = ?')
+        params.append(author_id)
+    if since is not None:
+        conditions.append('messages.timestamp >= ?')
+        params.append(since.strftime('%Y-%m-%d'))
+    if until is not None:
+        conditions.append('messages.timestamp < ?')
+        params.append((until + timedelta(days=1)).strftime('%Y-%m-%d'))
+    params.append(limit)
+    return conn.execute(f'''
+        SELECT messages.id, messages.chat_id, messages.user_id, messages.timestamp,
+               snippet(messages_fts, 0, '**', '**', '...', 16) AS snippet
+        FROM messages_fts
+        CROSS JOIN messages ON messages.id = messages_fts.rowid
+        WHERE {' AND '.join(conditions)}
+        ORDER BY messages.timestamp DESC, messages.id DESC
+        LIMIT ?
+    ''', params).fetchall()
+
+# The messages either side of message_id in its chat, oldest first, using the
+# same (timestamp, id) keyset as get_messages_page.
+def get_message_window(conn, chat_id, message_id, radius=10):
+    target = conn.execute('SELECT * FROM messages WHERE id = ? AND chat_id = ?', (message_id, chat_id)).fetchone()
+    if target is None:
+        return []
+    older = conn.execute('''
+        SELECT * FROM messages
+        WHERE chat_id = ? AND (timestamp, id) < (?, ?)
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    ''', (chat_id, target['timestamp'], target['id'], radius)).fetchall()
+    newer = conn.execute('''
+        SELECT * FROM messages
+        WHERE chat_id = ? AND (timestamp, id) > (?, ?)
+        ORDER BY timestamp ASC, id ASC
+        LIMIT ?
+    ''', (chat_id, target['timestamp'], target['id'], radius)).fetchall()
+    return list(reversed(older)) + [target] + newer
+
+def jump_to_message(chat_id, message_id):
+    st.session_state.chat_select = chat_id
+    st.session_state.chat_jump = (chat_id, message_id)
+
+def message_search(conn, selected_chat_id, chat_names):
+    with st.expander("Search Messages"):
+        text = st.text_input("Search for", key="chat_search_text")
+        all_chats = st.checkbox("Search all chats", key="chat_search_all")
+        user_names = get_user_names()
+        author_id = st.selectbox("Author", [None] + list(user_names),
+                                 format_func=lambda user_id: "Anyone" if user_id is None else user_names[user_id],
+                                 key="chat_search_author")
+        col1, col2 = st.columns(2)
+        with col1:
+            since = st.date_input("From", value=None, key="chat_search_since")
+        with col2:
+            until = st.date_input("Until", value=None, key="chat_search_until")
+
+        if not text.strip():
+            return
+        hits = search_messages(conn, text, None if all_chats else selected_chat_id, author_id, since, until)
+        if not hits:
+            st.write("No messages found.")
+        for hit in hits:
+            chat_name = chat_names.get(hit['chat_id'], "Unknown Chat")
+            st.write(f"[{chat_name}] {get_user_name(hit['user_id'])} ({format_timestamp(hit['timestamp'])}): {hit['snippet']}")
+            st.button("Jump to message", key=f"jump_{hit['id']}",
+                      on_click=jump_to_message, args=(hit['chat_id'], hit['id']))
+
+def show_message(message, highlight=False):
+    # User names come from the shared directory cache
+    user_name = get_user_name(message['user_id'])
+    line = f"{user_name} ({format_timestamp(message['timestamp'])}): {message['message']}"
+    if highlight:
+        st.info(line)
+    else:
+        st.write(line)
+
+# Live view of the newest messages. Only this fragment reruns on the timer; each
+# run polls for messages newer than the last one in the session's buffer.
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_messages(chat_id):
+    buffers = st.session_state.setdefault('chat_live_buffers', {})
+    conn = get_db_connection()
+    buffer = buffers.get(chat_id)
+    new_messages = get_new_messages(conn, chat_id, buffer['last_id']) if buffer else []
+    if buffer is None or len(new_messages) == LIVE_BUFFER_SIZE:
+        # First view, or too far behind to catch up: start from the latest page
+        latest = get_messages_page(conn, chat_id, st.session_state.messages_per_page)
+        buffer = buffers[chat_id] = {'messages': [dict(m) for m in reversed(latest)],
+                                     'last_id': latest[0]['id'] if latest else 0}
+    elif new_messages:
+        buffer['messages'].extend(dict(m) for m in new_messages)
+        del buffer['messages'][:-LIVE_BUFFER_SIZE]
+        buffer['last_id'] = new_messages[-1]['id']
+    conn.close()
+
+    if not buffer['messages']:
+        st.write("No messages in this chat.")
+    for message in buffer['messages']:
+        show_message(message)
+
 def chat_section():
     st.title("Group Chats")
     conn = get_db_connection()
 
     # Fetch chats
-    chats = conn.execute('SELECT * FROM chats').fetchall()
+    chats = query_cache.fetchall(conn, 'SELECT * FROM chats')
 
     if not chats:
         st.write("No chats available.")
@@ -30,56 +173,65 @@ def chat_section():
     selected_chat_id = st.selectbox(
         "Select Chat",
         chat_options,
-        format_func=lambda chat_id: chat_names.get(chat_id, "Unknown Chat")
+        format_func=lambda chat_id: chat_names.get(chat_id, "Unknown Chat"),
+        key="chat_select"
     )
 
     if selected_chat_id:
         st.write(f"Chat: {chat_names.get(selected_chat_id, 'Unknown Chat')}")
 
-        # Pagination variables
-        if 'message_offset' not in st.session_state:
-            st.session_state.message_offset = 0
+        # Pagination variables: one stack of cursors per chat
+        if 'chat_cursors' not in st.session_state:
+            st.session_state.chat_cursors = {}
         if 'messages_per_page' not in st.session_state:
             st.session_state.messages_per_page = 10
+        cursors = st.session_state.chat_cursors.setdefault(selected_chat_id, [])
 
-        # Load messages
-        messages_query = '''
-            SELECT * FROM messages 
-            WHERE chat_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ? OFFSET ?
-        '''
-        messages = conn.execute(messages_query, (selected_chat_id, st.session_state.messages_per_page, st.session_state.message_offset)).fetchall()
+        message_search(conn, selected_chat_id, chat_names)
+        live = st.toggle("Live updates", key="chat_live")
+
+        # A search hit shows only the window around it instead of a page
+        jump = st.session_state.get('chat_jump')
+        if jump and jump[0] != selected_chat_id:
+            jump = st.session_state.chat_jump = None
+        if jump:
+            messages = list(reversed(get_message_window(conn, selected_chat_id, jump[1])))
+        elif live and not cursors:
+            live_messages(selected_chat_id)
+            messages = None
+        else:
+            # Load messages
+            before = cursors[-1] if cursors else None
+            messages = get_messages_page(conn, selected_chat_id, st.session_state.messages_per_page, before)
 
         if messages:
             for message in reversed(messages):
-                user_id = message['user_id']
-                timestamp = message['timestamp']
-                msg_content = message['message']
-
-                # Fetch user name for display
-                user_name_query = 'SELECT name FROM users WHERE id = ?'
-                user_name_row = conn.execute(user_name_query, (user_id,)).fetchone()
-                user_name = user_name_row['name'] if user_name_row else 'Unknown User'
-
-                st.write(f"{user_name} ({format_timestamp(timestamp)}): {msg_content}")
-                
+                show_message(message, highlight=bool(jump) and message['id'] == jump[1])
 
             # Load more button
-            if len(messages) == st.session_state.messages_per_page:
+            if not jump and len(messages) == st.session_state.messages_per_page:
                 if st.button("Load More"):
-                    st.session_state.message_offset += st.session_state.messages_per_page
+                    oldest = messages[-1]
+                    cursors.append((oldest['timestamp'], oldest['id']))
                     st.rerun()
 
-        else:
+        elif messages is not None:
             st.write("No messages in this chat.")
 
+        if cursors or jump:
+            if st.button("Back to Latest"):
+                cursors.clear()
+                st.session_state.chat_jump = None
+                st.rerun()
+
         # Purge chat button (admin only)
         is_admin = st.session_state.get('user', {}).get('is_admin', 0)
         if is_admin:
             if st.button("Purge Chat"):
                 conn.execute('DELETE FROM messages WHERE chat_id = ?', (selected_chat_id,))
                 conn.commit()
+                cursors.clear()
+                st.session_state.get('chat_live_buffers', {}).pop(selected_chat_id, None)
                 st.success("Chat purged successfully!")
                 st.rerun()
 
@@ -90,11 +242,11 @@ def chat_section():
             if new_message:
                 user_id = st.session_state.get('user', {}).get('id', None)
                 if user_id:
-                    conn.execute(
+                    writer.execute(
                         'INSERT INTO messages (chat_id, user_id, message) VALUES (?, ?, ?)',
                         (selected_chat_id, user_id, new_message)
                     )
-                    conn.commit()
+                    cursors.clear()
                     st.success("Message sent!")
                     st.rerun()
                 else:
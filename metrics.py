@@ -0,0 +1,160 @@
+import bisect
+import functools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# In-memory latency histograms for SQL statements and page renders, shared by
+# every session in the process. db.py times each statement through a wrapping
+# cursor and app.main() times each page; the admin Performance tab reads them
+# back with summary() and prometheus_text() renders the Prometheus text format.
+# If DASHBOARD_METRICS_FILE is set, maybe_write_file() keeps that file updated
+# for the node_exporter textfile collector.
+
+TRACE_QUERIES = os.environ.get('DASHBOARD_TRACE_QUERIES', '1') != '0'
+METRICS_FILE = os.environ.get('DASHBOARD_METRICS_FILE')
+WRITE_INTERVAL = 15
+# Bucket upper bounds in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Distinct statements tracked; anything past this is counted as "other"
+MAX_STATEMENTS = 500
+
+_IN_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    # Estimated by interpolating inside the bucket the quantile falls in
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                low = BUCKETS[i - 1] if i else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(self.max, low + (high - low) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+
+_lock = threading.Lock()
+_histograms = {'query': {}, 'render': {}}
+_gauges = {}
+_last_write = 0.0
+
+
+# Statements differing only in the length of an IN (?, ?, ...) list share a label
+@functools.lru_cache(maxsize=2048)
+def statement_label(sql):
+    return _IN_LIST.sub('?, ...', ' '.join(sql.split()))
+
+def _histogram(kind, label):
+    histograms = _histograms[kind]
+    histogram = histograms.get(label)
+    if histogram is None:
+        if kind == 'query' and len(histograms) >= MAX_STATEMENTS:
+            label = 'other'
+            histogram = histograms.get(label)
+        if histogram is None:
+            histogram = histograms[label] = Histogram()
+    return histogram
+
+def observe(kind, label, seconds):
+    with _lock:
+        _histogram(kind, label).observe(seconds)
+
+def add_rows(label, rows):
+    with _lock:
+        _histogram('query', label).rows += rows
+
+@contextmanager
+def timed(kind, label):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(kind, label, time.perf_counter() - start)
+
+# fn() returns a dict of numbers, exported as gauges named prefix_key
+def register_gauges(prefix, fn):
+    _gauges[prefix] = fn
+
+def reset():
+    with _lock:
+        for histograms in _histograms.values():
+            histograms.clear()
+
+
+# One dict per label, slowest total time first, durations in milliseconds
+def summary(kind):
+    with _lock:
+        rows = [{'label': label, 'count': h.count, 'total_ms': h.sum * 1000,
+                 'mean_ms': h.sum / h.count * 1000 if h.count else 0.0,
+                 'p50_ms': h.quantile(0.5) * 1000, 'p95_ms': h.quantile(0.95) * 1000,
+                 'max_ms': h.max * 1000, 'rows': h.rows}
+                for label, h in _histograms[kind].items()]
+    if kind != 'query':
+        for row in rows:
+            del row['rows']
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text():
+    lines = []
+    with _lock:
+        for kind, name, label_name in (('query', 'dashboard_query_duration_seconds', 'statement'),
+                                       ('render', 'dashboard_page_render_seconds', 'page')):
+            lines.append(f"# TYPE {name} histogram")
+            for label, h in _histograms[kind].items():
+                label = f'{label_name}="{_escape(label)}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS + ('+Inf',), h.buckets):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label}}} {h.sum}')
+                lines.append(f'{name}_count{{{label}}} {h.count}')
+        lines.append("# TYPE dashboard_query_rows_total counter")
+        for label, h in _histograms['query'].items():
+            lines.append(f'dashboard_query_rows_total{{statement="{_escape(label)}"}} {h.rows}')
+    for prefix, fn in _gauges.items():
+        for key, value in fn().items():
+            lines.append(f"# TYPE dashboard_{prefix}_{key} gauge")
+            lines.append(f"dashboard_{prefix}_{key} {value}")
+    return '\n'.join(lines) + '\n'
+
+def write_file(path):
+    # Written aside and renamed so a scrape never sees a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+def maybe_write_file(now=None):
+    global _last_write
+    if not METRICS_FILE:
+        return
+    now = now or time.monotonic()
+    with _lock:
+        if now - _last_write < WRITE_INTERVAL:
+            return
+        _last_write = now
+    write_file(METRICS_FILE)
@@ -1,56 +1,122 @@
 import streamlit as st
-import sqlite3
-import pickle
-import requests
-from bs4 import BeautifulSoup
+import attachments
+import query_cache
+import writer
+from db import get_db_connection, fts_query
 
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+def insert_note(conn, user_id, note_title, content, files, is_global):
+    cursor = conn.execute('INSERT INTO notes (user_id, title, content, is_global) VALUES (?, ?, ?, ?)', 
+                          (user_id, note_title, content, is_global))
+    attachments.attach_files(conn, cursor.lastrowid, files)
+    return cursor.lastrowid
 
 def save_note_with_files(user_id, note_title, content, files, is_global):
     conn = get_db_connection()
-    serialized_files = pickle.dumps(files)
-    conn.execute('INSERT INTO notes (user_id, title, content, files, is_global) VALUES (?, ?, ?, ?, ?)', 
-                 (user_id, note_title, content, serialized_files, is_global))
-    conn.commit()
-    conn.close()
+    try:
+        insert_note(conn, user_id, note_title, content, files, is_global)
+        conn.commit()
+    finally:
+        conn.close()
+
+# Saves (title, content) pairs as notes in a single transaction
+def save_notes(user_id, notes, is_global):
+    conn = get_db_connection()
+    try:
+        for note_title, content in notes:
+            insert_note(conn, user_id, note_title, content, [], is_global)
+        conn.commit()
+    finally:
+        conn.close()
 
+# files=None keeps the note's current attachments
 def update_note(note_id, title, content, files, is_global):
     conn = get_db_connection()
-    serialized_files = pickle.dumps(files)
-    conn.execute('UPDATE notes SET title = ?, content = ?, files = ?, is_global = ? WHERE id = ?',
-                 (title, content, serialized_files, is_global, note_id))
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute('UPDATE notes SET title = ?, content = ?, is_global = ? WHERE id = ?',
+                     (title, content, is_global, note_id))
+        if files is not None:
+            attachments.detach_all(conn, note_id)
+            attachments.attach_files(conn, note_id, files)
+        conn.commit()
+    finally:
+        conn.close()
 
 def delete_note(note_id):
     conn = get_db_connection()
     conn.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+    attachments.detach_all(conn, note_id)
     conn.commit()
     conn.close()
 
-def pin_unpin(note_id, pin_status):
+# Reads an attachment's bytes for a download; raises FileNotFoundError if the
+# attachment was pruned since the page was rendered
+def read_attachment(digest):
     conn = get_db_connection()
-    conn.execute('UPDATE notes SET is_pinned = ? WHERE id = ?', (pin_status, note_id))
-    conn.commit()
-    conn.close()
+    try:
+        reader = attachments.open_reader(conn, digest)
+        if reader is None:
+            raise FileNotFoundError(f"attachment {digest} no longer exists")
+        with reader:
+            return reader.read()
+    finally:
+        conn.close()
+
+# Streamlit calls data only when the button is clicked, so rendering a note
+# never reads its attachments
+def attachment_download_button(file):
+    st.download_button(label=f"{file['name']} ({file['size']} bytes)",
+                       data=lambda: read_attachment(file['hash']),
+                       file_name=file['name'], mime=file['mime'], key=f"download_file_{file['id']}",
+                       on_click="ignore")
+
+def pin_unpin(note_id, pin_status):
+    writer.execute('UPDATE notes SET is_pinned = ? WHERE id = ?', (pin_status, note_id))
+
+# Ranked full-text search over the notes visible to user_id; titles weigh
+# more than content.
+def search_notes(conn, user_id, text, limit=50):
+    query = fts_query(text)
+    if query is None:
+        return []
+    return conn.execute('''
+        SELECT notes.id, notes.user_id, notes.title, notes.content, notes.is_global, notes.is_pinned,
+               snippet(notes_fts, 1, '**', '**', '...', 24) AS snippet
+        FROM notes_fts
+        JOIN notes ON notes.id = notes_fts.rowid
+        WHERE notes_fts MATCH ? AND (notes.is_global = 1 OR notes.user_id = ?)
+        ORDER BY bm25(notes_fts, 10.0, 1.0)
+        LIMIT ?
+    ''', (query, user_id, limit)).fetchall()
+
+# Every note visible to user_id, pinned first then newest first
+def list_notes(conn, user_id):
+    return query_cache.fetchall(conn, '''
+        SELECT id, user_id, title, content, is_global, is_pinned FROM notes
+        WHERE is_global = 1 OR user_id = ?
+        ORDER BY is_pinned DESC, id DESC
+    ''', (user_id,))
 
 def view_notes(user_id):
+    search_text = st.text_input("Search notes", key="notes_search")
     conn = get_db_connection()
     user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
     is_admin = user['is_admin'] if user else False
-    notes = conn.execute('SELECT * FROM notes WHERE is_global = 1 OR user_id = ? ORDER BY is_pinned DESC, id DESC', (user_id,)).fetchall()
+    if search_text.strip():
+        notes = search_notes(conn, user_id, search_text)
+        if not notes:
+            st.write("No notes match your search.")
+    else:
+        notes = list_notes(conn, user_id)
+    note_files = attachments.list_for_notes(conn, [note['id'] for note in notes])
     conn.close()
 
     for note in notes:
         with st.expander(note['title'], expanded=True):
+            if 'snippet' in note.keys():
+                st.caption(note['snippet'])
             st.write(note['content'])
-            if note['files']:
-                files = pickle.loads(note['files'])
-                for i, file in enumerate(files):
-                    st.download_button(label=f"Download File {i + 1}", data=file, key=f"download_file_{note['id']}_{i}")
+            for file in note_files[note['id']]:
+                attachment_download_button(file)
 
             can_edit = note['user_id'] == user_id or is_admin
             can_delete = can_edit
@@ -68,7 +134,6 @@ def view_notes(user_id):
                     st.session_state.edit_note_id = note['id']
                     st.session_state.edit_note_title = note['title']
                     st.session_state.edit_note_content = note['content']
-                    st.session_state.edit_note_files = pickle.loads(note['files'])
                     st.session_state.edit_note_is_global = note['is_global']
 
             if can_delete:
@@ -87,14 +152,16 @@ def view_notes(user_id):
 
         if st.button("Update Note", key="update_note_button"):
             if new_title and new_content:
-                updated_files = [file.read() for file in new_files] if new_files else st.session_state.edit_note_files
-                update_note(st.session_state.edit_note_id, new_title, new_content, updated_files, new_is_global == "Global")
+                try:
+                    update_note(st.session_state.edit_note_id, new_title, new_content, new_files or None, new_is_global == "Global")
+                except attachments.AttachmentTooLarge as e:
+                    st.error(str(e))
+                    return
                 st.success("Note updated successfully!")
                 
                 del st.session_state.edit_note_id
                 del st.session_state.edit_note_title
                 del st.session_state.edit_note_content
-                del st.session_state.edit_note_files
                 del st.session_state.edit_note_is_global
                 st.rerun()
             else:
@@ -114,8 +181,11 @@ def create_note():
 
     if st.button("Save Note", key="save_note_button"):
         if note_title and note_content:
-            files = [file.read() for file in uploaded_files]
-            save_note_with_files(user_id, note_title, note_content, files, note_type == "Global")
+            try:
+                save_note_with_files(user_id, note_title, note_content, uploaded_files, note_type == "Global")
+            except attachments.AttachmentTooLarge as e:
+                st.error(str(e))
+                return
             st.success("Note saved successfully!")
             st.rerun()
         else:
@@ -127,10 +197,12 @@ def import_from_link():
     
     if st.button("Import Text", key="import_text_button"):
         if url:
+            # requests and bs4 are only imported once someone imports a link
+            import fetcher
+            from bs4 import BeautifulSoup
             try:
-                response = requests.get(url)
-                response.raise_for_status()  # Check for HTTP errors
-                soup = BeautifulSoup(response.text, 'html.parser')
+                page = fetcher.fetch(url)
+                soup = BeautifulSoup(page.content, 'html.parser', from_encoding=page.encoding)
                 text_content = soup.get_text()
 
                 st.session_state.import_note_content = text_content
@@ -173,10 +245,56 @@ def import_from_link():
         else:
             st.error("URL cannot be empty.")
 
+def extract_page(page):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page.content, 'html.parser', from_encoding=page.encoding)
+    title = soup.title.get_text(strip=True) if soup.title else ''
+    return title or page.url, soup.get_text()
+
+def bulk_import_links():
+    st.write("## Import Notes from Several Links")
+    user_id = st.session_state.get('user', {}).get('id', None)
+    pasted = st.text_area("URLs, one per line", key="bulk_import_urls")
+    url_file = st.file_uploader("Or upload a text file of URLs", type=["txt", "csv"], key="bulk_import_file")
+    note_type = st.radio("Note Visibility", ("Local", "Global"), key="bulk_import_visibility")
+
+    if st.button("Import All", key="bulk_import_button"):
+        lines = pasted.splitlines()
+        if url_file is not None:
+            lines += url_file.getvalue().decode('utf-8', errors='replace').splitlines()
+        # Keep the first occurrence of each URL, in order
+        urls = list(dict.fromkeys(line.strip().strip(',') for line in lines if line.strip()))
+        if not urls:
+            st.error("Enter at least one URL.")
+            return
+        if user_id is None:
+            st.error("You need to be logged in to import notes.")
+            return
+
+        import fetcher
+        progress = st.progress(0.0, text=f"Fetched 0 of {len(urls)}")
+        status = st.empty()
+        outcome = {url: "Waiting" for url in urls}
+        imported = []
+        for done, result in enumerate(fetcher.fetch_many(urls, process=extract_page), start=1):
+            if result.error is None:
+                imported.append(result.value)
+                outcome[result.url] = "Fetched"
+            else:
+                outcome[result.url] = f"Failed: {result.error}"
+            progress.progress(done / len(urls), text=f"Fetched {done} of {len(urls)}")
+            status.table([{"URL": url, "Status": state} for url, state in outcome.items()])
+
+        if imported:
+            save_notes(user_id, imported, note_type == "Global")
+            st.success(f"Imported {len(imported)} of {len(urls)} links as notes.")
+        else:
+            st.error("None of the links could be imported.")
+
 def notes_main():
     user_id = st.session_state.get('user', {}).get('id', None)
     is_admin = st.session_state.get('is_admin', False)
-    tabs = st.tabs(["View Notes", "Create Note", "Import from Link"])
+    tabs = st.tabs(["View Notes", "Create Note", "Import from Link", "Bulk Import"])
 
     with tabs[0]:
         view_notes(user_id)
@@ -187,5 +305,8 @@ def notes_main():
     with tabs[2]:
         import_from_link()
 
+    with tabs[3]:
+        bulk_import_links()
+
 if __name__ == "__main__":
     notes_main()
@@ -0,0 +1,27 @@
+import streamlit as st
+
+# Keyset paging for Streamlit lists. Each list (key) keeps a stack of cursors
+# in session state, one per page already passed; the top one is where the
+# current page starts. The stack resets when the list's filters change.
+
+def cursor_stack(key, filters=None):
+    stacks = st.session_state.setdefault('cursor_stacks', {})
+    if key not in stacks or stacks[key]['filters'] != filters:
+        stacks[key] = {'filters': filters, 'cursors': []}
+    return stacks[key]['cursors']
+
+def current_cursor(cursors, default=None):
+    return cursors[-1] if cursors else default
+
+# Previous/Next buttons; next_cursor is where the following page starts, or
+# None on the last page
+def page_controls(key, cursors, next_cursor):
+    col1, col2 = st.columns(2)
+    with col1:
+        if cursors and st.button("Previous Page", key=f"{key}_prev"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if next_cursor is not None and st.button("Next Page", key=f"{key}_next"):
+            cursors.append(next_cursor)
+            st.rerun()
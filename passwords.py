@@ -0,0 +1,57 @@
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+# Password hashing runs in a small process pool so PBKDF2 work never blocks the
+# Streamlit script threads (or holds the GIL they need). Changing HASH_METHOD
+# upgrades stored hashes the next time each user logs in.
+
+HASH_METHOD = os.environ.get('DASHBOARD_HASH_METHOD', 'pbkdf2:sha256:1000000')
+HASH_WORKERS = int(os.environ.get('DASHBOARD_HASH_WORKERS', str(min(4, max(2, os.cpu_count() or 1)))))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the server process has many threads running
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def hash_password(password):
+    return _pool().submit(generate_password_hash, password, HASH_METHOD).result()
+
+def hash_passwords(passwords):
+    return list(_pool().map(generate_password_hash, passwords, [HASH_METHOD] * len(passwords)))
+
+def verify_password(pwhash, password):
+    return _pool().submit(check_password_hash, pwhash, password).result()
+
+# werkzeug stores the method with its defaults filled in ("pbkdf2:sha256"
+# becomes "pbkdf2:sha256:1000000"), so compare against what it actually writes.
+# pbkdf2 defaults are filled in here; other methods hash once to find out.
+@functools.lru_cache(maxsize=None)
+def _stored_method(method):
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return _pool().submit(generate_password_hash, '', method).result().split('$', 1)[0]
+
+def needs_rehash(pwhash):
+    return pwhash.split('$', 1)[0] != _stored_method(HASH_METHOD)
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
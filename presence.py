@@ -0,0 +1,66 @@
+import threading
+import time
+
+from db import get_db_connection
+import writer
+
+# Heartbeat-based presence. Sessions call touch() freely; at most one
+# heartbeat per user per TOUCH_INTERVAL is recorded, held in memory and written
+# in one batch at most every FLUSH_INTERVAL. A user counts as online while
+# their last heartbeat is younger than ONLINE_TTL, so closed tabs expire on
+# their own. Presence writes go through the background writer and are not
+# waited on.
+
+TOUCH_INTERVAL = 30
+FLUSH_INTERVAL = 15
+ONLINE_TTL = 120
+
+_lock = threading.Lock()
+_pending = {}
+_last_touch = {}
+_last_flush = 0.0
+
+def touch(user_id, now=None):
+    now = now or time.time()
+    with _lock:
+        if now - _last_touch.get(user_id, 0.0) < TOUCH_INTERVAL:
+            return
+        _last_touch[user_id] = now
+        _pending[user_id] = now
+        due = now - _last_flush >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+def flush():
+    global _last_flush
+    with _lock:
+        batch = list(_pending.items())
+        _pending.clear()
+        _last_flush = time.time()
+    if not batch:
+        return None
+    return writer.submit('''
+        INSERT INTO presence (user_id, last_seen) VALUES (?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen)
+    ''', batch, many=True)
+
+def go_offline(user_id):
+    with _lock:
+        _pending.pop(user_id, None)
+        _last_touch.pop(user_id, None)
+    return writer.submit('DELETE FROM presence WHERE user_id = ?', (user_id,))
+
+def online_users(ttl=ONLINE_TTL):
+    pending = flush()
+    if pending is not None:
+        pending.result(writer.TIMEOUT)
+    conn = get_db_connection()
+    users = conn.execute('''
+        SELECT users.id, users.username, users.name, presence.last_seen
+        FROM presence
+        JOIN users ON users.id = presence.user_id
+        WHERE presence.last_seen >= ?
+        ORDER BY presence.last_seen DESC
+    ''', (time.time() - ttl,)).fetchall()
+    conn.close()
+    return users
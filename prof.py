@@ -1,10 +1,9 @@
-import sqlite3
+import math
 import streamlit as st
+from db import get_db_connection
+from user_directory import search as search_profiles
 
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+PROFILES_PER_PAGE = 20
 
 def edit_profile():
     st.title("Edit Profile")
@@ -27,12 +26,17 @@ def edit_profile():
 
 def view_profiles():
     st.title("View Profiles")
-    conn = get_db_connection()
-    profiles = conn.execute('SELECT * FROM users').fetchall()
-    conn.close()
+    # Public fields only, served from the shared user directory cache
+    profiles = search_profiles(st.text_input("Search profiles", key="profile_search"))
+    page_count = max(1, math.ceil(len(profiles) / PROFILES_PER_PAGE))
+    if st.session_state.get('profile_page', 1) > page_count:
+        st.session_state.profile_page = 1
+    page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key="profile_page")
+    st.caption(f"{len(profiles)} profiles, page {page} of {page_count}")
+    start = (page - 1) * PROFILES_PER_PAGE
 
     # Display profiles in a more structured layout
-    for profile in profiles:
+    for profile in profiles[start:start + PROFILES_PER_PAGE]:
         st.subheader(profile['name'])
         
         # Displaying profile information in a cleaner format
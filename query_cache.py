@@ -0,0 +1,153 @@
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import db
+import metrics
+
+# Process-wide cache of read query results, shared by every session. Entries
+# are keyed by database, SQL and parameters and remember the write generation
+# of each table the query reads. Pooled connections report the tables each
+# committed transaction wrote (db.PooledConnection.commit), which bumps their
+# generations, so an entry is served only while none of its tables changed.
+#
+# Writes from other processes don't pass through commit() here. With
+# DASHBOARD_EXTERNAL_WRITERS=1 a separate connection polls PRAGMA data_version
+# at most every EXTERNAL_CHECK_INTERVAL and drops the whole cache when it
+# moved. It also moves for this process's own commits, so that mode trades hit
+# rate for never serving another process's stale data for long.
+
+MAX_BYTES = int(os.environ.get('DASHBOARD_QUERY_CACHE_MB', '64')) * 1024 * 1024
+EXTERNAL_WRITERS = os.environ.get('DASHBOARD_EXTERNAL_WRITERS', '0') == '1'
+EXTERNAL_CHECK_INTERVAL = 1.0
+# Writes to a table also change the tables its triggers maintain
+TRIGGERED = {'notes': ('notes_fts',), 'messages': ('messages_fts',)}
+
+_READ_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)', re.IGNORECASE)
+_WRITE_TABLE = re.compile(r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)',
+                          re.IGNORECASE)
+_SCHEMA_CHANGE = re.compile(r'^\s*(?:CREATE|DROP|ALTER)\b', re.IGNORECASE)
+ALL_TABLES = '*'
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_bytes = 0
+_generations = {}
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_external = {'conn': None, 'path': None, 'data_version': None, 'checked': 0.0}
+
+
+@functools.lru_cache(maxsize=1024)
+def read_tables(sql):
+    return tuple(sorted({table.lower() for table in _READ_TABLES.findall(sql)}))
+
+# Tables a statement writes: empty for reads, ALL_TABLES for schema changes
+@functools.lru_cache(maxsize=1024)
+def written_tables(sql):
+    match = _WRITE_TABLE.match(sql)
+    if match:
+        table = match.group(1).lower()
+        return frozenset((table,) + TRIGGERED.get(table, ()))
+    if _SCHEMA_CHANGE.match(sql):
+        return frozenset((ALL_TABLES,))
+    return frozenset()
+
+def bump(tables):
+    with _lock:
+        if ALL_TABLES in tables:
+            _clear()
+            return
+        for table in tables:
+            _generations[table] = _generations.get(table, 0) + 1
+
+# An opaque token that changes whenever any of tables is written, for callers
+# keeping derived data of their own (see user_directory)
+def version(*tables):
+    _check_external()
+    with _lock:
+        return (_generations.get(ALL_TABLES, 0),) + tuple(_generations.get(table, 0) for table in tables)
+
+def clear():
+    with _lock:
+        _clear()
+
+def _clear():
+    global _bytes
+    _entries.clear()
+    _bytes = 0
+    # Outstanding version() tokens must not match again
+    _generations[ALL_TABLES] = _generations.get(ALL_TABLES, 0) + 1
+
+def stats():
+    with _lock:
+        return dict(_stats, entries=len(_entries), bytes=_bytes)
+
+
+def _size(rows):
+    size = 64
+    for row in rows:
+        size += 64
+        for value in row:
+            size += len(value) if isinstance(value, (str, bytes)) else 8
+    return size
+
+def _check_external():
+    if not EXTERNAL_WRITERS:
+        return
+    path = db.DB_PATH
+    now = time.monotonic()
+    with _lock:
+        if now - _external['checked'] < EXTERNAL_CHECK_INTERVAL and _external['path'] == path:
+            return
+        _external['checked'] = now
+        if _external['path'] != path:
+            if _external['conn'] is not None:
+                _external['conn'].close()
+            _external.update(conn=sqlite3.connect(path, check_same_thread=False), path=path, data_version=None)
+        data_version = _external['conn'].execute('PRAGMA data_version').fetchone()[0]
+        if data_version != _external['data_version']:
+            _clear()
+        _external['data_version'] = data_version
+
+# All rows of a read query, from the cache while its tables are unchanged.
+# Rows are shared between sessions and must not be modified.
+def fetchall(conn, sql, params=()):
+    global _bytes
+    params = tuple(params)
+    key = (conn.db_path, sql, params)
+    tables = read_tables(sql)
+    # This connection's own uncommitted writes aren't visible to anyone else
+    if not conn._dirty.isdisjoint(tables + (ALL_TABLES,)):
+        return conn.execute(sql, params).fetchall()
+    current = version(*tables)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == current:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return list(entry[1])
+        _stats['misses'] += 1
+    # The version is taken before reading, so a write landing meanwhile makes
+    # this entry stale rather than hiding the write
+    rows = conn.execute(sql, params).fetchall()
+    size = _size(rows)
+    if size > MAX_BYTES // 4:
+        return rows
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _bytes -= old[2]
+        _entries[key] = (current, tuple(rows), size)
+        _bytes += size
+        while _bytes > MAX_BYTES:
+            _, (_, _, evicted) = _entries.popitem(last=False)
+            _bytes -= evicted
+            _stats['evictions'] += 1
+    return rows
+
+
+metrics.register_gauges('query_cache', stats)
@@ -0,0 +1,39 @@
+import threading
+import time
+
+# Token-bucket rate limiting keyed by arbitrary hashable keys. Each key may
+# make `capacity` attempts in a burst, regaining one every `refill_seconds`.
+
+class RateLimiter:
+    def __init__(self, capacity, refill_seconds, max_keys=10000):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) / self.refill_seconds)
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(key, now)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return True
+
+    def retry_after(self, key):
+        with self._lock:
+            tokens = self._tokens(key, time.monotonic())
+        return max(0.0, (1 - tokens) * self.refill_seconds)
+
+    def _prune(self, now):
+        # Full buckets carry no state worth keeping
+        for key in [key for key in self._buckets if self._tokens(key, now) >= self.capacity]:
+            del self._buckets[key]
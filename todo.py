@@ -1,8 +1,57 @@
 import streamlit as st
 from db import get_db_connection
+from user_directory import get_user_names
+from paging import cursor_stack, current_cursor, page_controls
 from datetime import datetime, timedelta
 import random
 
+TASKS_PER_PAGE = 25
+CLAIM_DAYS = 7
+
+# Whole days until the deadline, rounded down like timedelta.days
+_DAYS_LEFT = "(julianday(tasks.deadline) - julianday('now', 'localtime'))"
+DAYS_REMAINING = f"(CAST({_DAYS_LEFT} AS INTEGER) - ({_DAYS_LEFT} < CAST({_DAYS_LEFT} AS INTEGER)))"
+
+# One page of assigned tasks with assignee names and days remaining, ordered
+# by (deadline, id) and keyset-paged with `after` = (deadline, id) of the last
+# row of the previous page. Done tasks are listed latest deadline first.
+def get_task_board(conn, is_done=0, assignee=None, due_from=None, due_to=None, after=None, limit=TASKS_PER_PAGE):
+    conditions = ['tasks.user_id IS NOT NULL', 'tasks.is_done = ?']
+    params = [is_done]
+    if assignee is not None:
+        conditions.append('tasks.user_id = ?')
+        params.append(assignee)
+    if due_from is not None:
+        conditions.append('tasks.deadline >= ?')
+        params.append(due_from.strftime('%Y-%m-%d'))
+    if due_to is not None:
+        conditions.append('tasks.deadline <= ?')
+        params.append(due_to.strftime('%Y-%m-%d'))
+    direction, compare = ('DESC', '<') if is_done else ('ASC', '>')
+    if after is not None:
+        conditions.append(f'(tasks.deadline, tasks.id) {compare} (?, ?)')
+        params += list(after)
+    params.append(limit)
+    return conn.execute(f'''
+        SELECT tasks.id, tasks.user_id, tasks.task, tasks.is_done, tasks.deadline, tasks.task_id,
+               users.name AS user_name, {DAYS_REMAINING} AS days_remaining
+        FROM tasks
+        LEFT JOIN users ON users.id = tasks.user_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY tasks.deadline {direction}, tasks.id {direction}
+        LIMIT ?
+    ''', params).fetchall()
+
+# Renders Previous/Next controls and returns the current page
+def paged_task_board(key, conn, **filters):
+    cursors = cursor_stack(key, filters)
+    tasks = get_task_board(conn, after=current_cursor(cursors), **filters)
+    page_controls(key, cursors, (tasks[-1]['deadline'], tasks[-1]['id']) if len(tasks) == TASKS_PER_PAGE else None)
+    return tasks
+
+def assignee_label(task):
+    return task['user_name'] if task['user_name'] is not None else "[User not found]"
+
 def todo_section():
     st.title("To-Do List")
     user_id = st.session_state['user']['id']
@@ -31,10 +80,10 @@ def todo_section():
 
 def show_current_work(user_id, conn):
     st.subheader("Your Current Tasks")
-    tasks = conn.execute('SELECT * FROM tasks WHERE user_id = ? AND is_done = 0', (user_id,)).fetchall()
+    tasks = paged_task_board('current', conn, is_done=0, assignee=user_id)
     for task in tasks:
         deadline = task['deadline']
-        remaining_days = (datetime.strptime(deadline, '%Y-%m-%d') - datetime.now()).days
+        remaining_days = task['days_remaining']
 
         with st.expander(f"Deadline: {deadline} ({remaining_days} days left)"):
             st.write(f"Task: {task['task']}")
@@ -47,29 +96,59 @@ def show_current_work(user_id, conn):
                 st.warning("Reminder: Only 1 day left to complete this task!")
 
     st.subheader("Past Tasks")
-    past_tasks = conn.execute('SELECT * FROM tasks WHERE user_id = ? AND is_done = 1', (user_id,)).fetchall()
+    past_tasks = paged_task_board('past', conn, is_done=1, assignee=user_id)
     for task in past_tasks:
         st.write(f"{task['task']} - Completed on: {task['deadline']}")
 
 def show_dropped_work(user_id, conn):
     st.subheader("Dropped Tasks")
-    tasks = conn.execute('SELECT * FROM tasks WHERE is_global = 1 AND user_id IS NULL').fetchall()
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        count = st.number_input("How many", min_value=1, max_value=50, step=1, key="claim_count")
+    with col2:
+        if st.button("Pick Up Next Tasks", key="claim_next"):
+            claimed = claim_next_tasks(user_id, int(count))
+            if claimed:
+                st.success(f"{len(claimed)} tasks assigned to you. Complete them within {CLAIM_DAYS} days.")
+            else:
+                st.info("There are no dropped tasks left.")
+
+    cursors = cursor_stack('dropped')
+    tasks = conn.execute('''
+        SELECT * FROM tasks
+        WHERE is_global = 1 AND user_id IS NULL AND id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (current_cursor(cursors, 0), TASKS_PER_PAGE)).fetchall()
     for task in tasks:
         st.write(f"{task['task']} - Task ID: {task['task_id']}")
         if st.button(f"Pick Up Task {task['id']}", key=f"pickup_{task['id']}"):
-            assign_task_to_user(task['id'], user_id)
-            st.success("Task assigned to you. Complete it within 7 days.")
-            st.rerun()
+            if claim_task(task['id'], user_id):
+                st.success(f"Task assigned to you. Complete it within {CLAIM_DAYS} days.")
+                st.rerun()
+            else:
+                st.error("Someone else picked up this task first.")
+
+    page_controls('dropped', cursors, tasks[-1]['id'] if len(tasks) == TASKS_PER_PAGE else None)
 
 def show_other_users_tasks(conn):
     st.subheader("Other Users' Tasks")
-    tasks = conn.execute('SELECT * FROM tasks WHERE user_id IS NOT NULL').fetchall()
+    user_names = get_user_names()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        assignee = st.selectbox("Assignee", [None] + list(user_names), key="board_assignee",
+                                format_func=lambda user_id: "Everyone" if user_id is None else user_names[user_id])
+    with col2:
+        status = st.selectbox("Status", ["Open", "Done"], key="board_status")
+    with col3:
+        due_from = st.date_input("Due from", value=None, key="board_due_from")
+    with col4:
+        due_to = st.date_input("Due until", value=None, key="board_due_to")
+
+    tasks = paged_task_board('others', conn, is_done=int(status == "Done"), assignee=assignee,
+                             due_from=due_from, due_to=due_to)
     for task in tasks:
-        user = conn.execute('SELECT name FROM users WHERE id = ?', (task['user_id'],)).fetchone()
-        if user:
-            st.write(f"{task['task']} - Assigned to: {user['name']} - Deadline: {task['deadline']}")
-        else:
-            st.write(f"{task['task']} - Assigned to: [User not found] - Deadline: {task['deadline']}")
+        st.write(f"{task['task']} - Assigned to: {assignee_label(task)} - Deadline: {task['deadline']}")
 
 def admin_panel(conn):
     st.subheader("Admin Panel - Create and Manage Tasks")
@@ -77,7 +156,7 @@ def admin_panel(conn):
     # Create new task
     with st.form(key='create_task'):
         task = st.text_input("New Task")
-        user_names = get_all_users(conn)
+        user_names = get_user_names()
         assigned_user_name = st.selectbox("Assign to User", list(user_names.values()))
         assigned_user_id = [k for k, v in user_names.items() if v == assigned_user_name][0]
         deadline = st.date_input("Deadline")
@@ -93,13 +172,9 @@ def admin_panel(conn):
 
     # View tasks, move to dropped work, and delete tasks
     st.subheader("Manage Current Tasks")
-    tasks = conn.execute('SELECT * FROM tasks WHERE user_id IS NOT NULL AND is_done = 0').fetchall()
+    tasks = paged_task_board('manage', conn, is_done=0)
     for task in tasks:
-        user = conn.execute('SELECT name FROM users WHERE id = ?', (task['user_id'],)).fetchone()
-        if user:
-            st.write(f"{task['task']} - Assigned to: {user['name']} - Deadline: {task['deadline']}")
-        else:
-            st.write(f"{task['task']} - Assigned to: [User not found] - Deadline: {task['deadline']}")
+        st.write(f"{task['task']} - Assigned to: {assignee_label(task)} - Deadline: {task['deadline']}")
         
         col1, col2 = st.columns(2)
         with col1:
@@ -127,12 +202,40 @@ def complete_task(task_id):
     conn.commit()
     conn.close()
 
-def assign_task_to_user(task_id, user_id):
+# Claiming is a conditional update: it only succeeds while the task is still
+# unassigned, so of two users picking up the same task exactly one wins.
+def claim_task(task_id, user_id):
     conn = get_db_connection()
-    deadline = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
-    conn.execute('UPDATE tasks SET user_id = ?, deadline = ? WHERE id = ?', (user_id, deadline, task_id))
+    deadline = (datetime.now() + timedelta(days=CLAIM_DAYS)).strftime('%Y-%m-%d')
+    cursor = conn.execute('UPDATE tasks SET user_id = ?, deadline = ? WHERE id = ? AND is_global = 1 AND user_id IS NULL',
+                          (user_id, deadline, task_id))
     conn.commit()
     conn.close()
+    return cursor.rowcount == 1
+
+# Claims up to count of the oldest unassigned dropped tasks in one transaction
+# and returns the ids claimed. BEGIN IMMEDIATE holds the write lock from the
+# SELECT on, so no other claimer can take the same tasks in between (and this
+# avoids UPDATE ... RETURNING, which needs SQLite 3.35).
+def claim_next_tasks(user_id, count):
+    conn = get_db_connection()
+    deadline = (datetime.now() + timedelta(days=CLAIM_DAYS)).strftime('%Y-%m-%d')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        claimed = [row['id'] for row in conn.execute('''
+            SELECT id FROM tasks
+            WHERE is_global = 1 AND user_id IS NULL
+            ORDER BY id
+            LIMIT ?
+        ''', (count,))]
+        if claimed:
+            placeholders = ', '.join('?' * len(claimed))
+            conn.execute(f'UPDATE tasks SET user_id = ?, deadline = ? WHERE id IN ({placeholders}) AND user_id IS NULL',
+                         [user_id, deadline] + claimed)
+        conn.commit()
+    finally:
+        conn.close()
+    return claimed
 
 def move_task_to_dropped(task_id):
     conn = get_db_connection()
@@ -144,8 +247,4 @@ def delete_task(task_id):
     conn = get_db_connection()
     conn.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
     conn.commit()
-    conn.close()
-
-def get_all_users(conn):
-    users = conn.execute('SELECT id, name FROM users').fetchall()
-    return {user['id']: user['name'] for user in users}
\ No newline at end of file
+    conn.close()
\ No newline at end of file
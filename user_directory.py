@@ -0,0 +1,50 @@
+import threading
+from db import get_db_connection
+import query_cache
+
+# Process-wide cache of public user details (id -> profile), shared by every
+# session. It's rebuilt when the users table's query cache version moves,
+# which every committed write to users does.
+PUBLIC_COLUMNS = ('id', 'name', 'job_profile', 'github', 'discord')
+
+_lock = threading.Lock()
+_cached = None
+
+def _load():
+    conn = get_db_connection()
+    rows = conn.execute(f"SELECT {', '.join(PUBLIC_COLUMNS)} FROM users ORDER BY id").fetchall()
+    conn.close()
+    return {row['id']: dict(row) for row in rows}
+
+def get_users():
+    global _cached
+    version = query_cache.version('users')
+    cached = _cached
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    # Taken before loading, so a write landing meanwhile forces a reload
+    users = _load()
+    with _lock:
+        _cached = (version, users)
+    return users
+
+def get_user_name(user_id, default='Unknown User'):
+    user = get_users().get(user_id)
+    return user['name'] if user else default
+
+def get_user_names():
+    return {user_id: user['name'] for user_id, user in get_users().items()}
+
+# Case-insensitive match on any public field; an empty search returns everyone
+def search(text):
+    users = list(get_users().values())
+    text = text.strip().lower()
+    if not text:
+        return users
+    return [user for user in users
+            if any(text in (user[column] or '').lower() for column in PUBLIC_COLUMNS if column != 'id')]
+
+def invalidate():
+    global _cached
+    with _lock:
+        _cached = None
@@ -0,0 +1,146 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import db
+import metrics
+
+# Single background writer. Sessions submit small writes (chat messages,
+# presence heartbeats, pin toggles) instead of committing their own
+# transactions; the writer thread groups whatever is queued, waiting at most
+# MAX_LATENCY for more, into one transaction. Each write runs in its own
+# savepoint, so one failing statement doesn't undo the rest of its batch.
+# If the writer can't reach the database at all, that batch fails and the
+# connection is opened again for the next one.
+
+MAX_BATCH = 256
+MAX_LATENCY = 0.005
+# Seconds execute() and executemany() wait for their write
+TIMEOUT = 30
+
+WriteResult = namedtuple('WriteResult', ['lastrowid', 'rowcount'])
+_Request = namedtuple('_Request', ['sql', 'params', 'many', 'future'])
+
+_queue = queue.Queue()
+_thread = None
+_thread_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'writes': 0, 'failed': 0, 'batches': 0, 'last_batch': 0, 'max_batch': 0}
+
+
+def submit(sql, params=(), many=False):
+    _ensure_started()
+    future = Future()
+    _queue.put(_Request(sql, params, many, future))
+    return future
+
+def execute(sql, params=(), timeout=TIMEOUT):
+    return submit(sql, params).result(timeout)
+
+def executemany(sql, seq_of_params, timeout=TIMEOUT):
+    return submit(sql, list(seq_of_params), many=True).result(timeout)
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot['queue_depth'] = _queue.qsize()
+    snapshot['mean_batch'] = snapshot['writes'] / snapshot['batches'] if snapshot['batches'] else 0.0
+    return snapshot
+
+
+metrics.register_gauges('writer', stats)
+
+
+def _ensure_started():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    with _thread_lock:
+        # Also replaces a writer that died, so queued writes aren't stranded
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name='db-writer', daemon=True)
+            _thread.start()
+
+def _next_batch():
+    batch = []
+    while not batch:
+        _take(batch, _queue.get())
+    deadline = time.monotonic() + MAX_LATENCY
+    while len(batch) < MAX_BATCH:
+        remaining = deadline - time.monotonic()
+        try:
+            _take(batch, _queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+# Drops writes whose caller cancelled them; the ones taken can't be cancelled
+# any more, so _settle can always resolve them
+def _take(batch, request):
+    if request.future.set_running_or_notify_cancel():
+        batch.append(request)
+
+def _run():
+    conn = None
+    while True:
+        batch = _next_batch()
+        try:
+            if conn is None or conn.db_path != db.DB_PATH:
+                _dispose(conn)
+                conn = None
+                conn = db.get_db_connection()
+            outcomes = _apply(conn, batch)
+        except Exception as e:
+            # Connecting or rolling back failed; start over on a new connection
+            _dispose(conn)
+            conn = None
+            outcomes = [(request.future, None, e) for request in batch]
+        _settle(batch, outcomes)
+
+def _dispose(conn):
+    if conn is None:
+        return
+    try:
+        conn.dispose()
+    except sqlite3.Error:
+        pass
+
+def _apply(conn, batch):
+    outcomes = []
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for request in batch:
+            conn.execute('SAVEPOINT batched_write')
+            try:
+                if request.many:
+                    cursor = conn.executemany(request.sql, request.params)
+                else:
+                    cursor = conn.execute(request.sql, request.params)
+                outcomes.append((request.future, WriteResult(cursor.lastrowid, cursor.rowcount), None))
+            except sqlite3.Error as e:
+                conn.execute('ROLLBACK TO batched_write')
+                outcomes.append((request.future, None, e))
+            conn.execute('RELEASE batched_write')
+        conn.commit()
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        outcomes = [(request.future, None, e) for request in batch]
+    return outcomes
+
+def _settle(batch, outcomes):
+    failed = sum(1 for _, _, error in outcomes if error is not None)
+    with _stats_lock:
+        _stats['writes'] += len(batch)
+        _stats['failed'] += failed
+        _stats['batches'] += 1
+        _stats['last_batch'] = len(batch)
+        _stats['max_batch'] = max(_stats['max_batch'], len(batch))
+    for future, result, error in outcomes:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)